@@ -1,22 +1,257 @@
+import argparse
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from zipfile import ZIP_DEFLATED, ZIP_STORED
+
+from bestdori_voice_extractor import console
 from bestdori_voice_extractor.analyzer.asset import AssetAnalyzer
 from bestdori_voice_extractor.analyzer.voice import VoiceAnalyzer
+from bestdori_voice_extractor.characters import band_characters
+from bestdori_voice_extractor.config import (
+    CATALOG_PATH,
+    CURRENT_LOCALE,
+    DATASET_SHARDS,
+    DATASET_VALIDATION,
+    MAX_WORKERS,
+    MERGE_FORMAT,
+    SERVICE_HOST,
+    SERVICE_JOBS,
+    SERVICE_OUTPUT_DIR,
+    SERVICE_PORT,
+    SERVICE_RETENTION,
+    TRANSCODE_SAMPLE_RATE,
+)
+from bestdori_voice_extractor.dataset import DatasetBuilder
+from bestdori_voice_extractor.downloader import locale_path
 from bestdori_voice_extractor.downloader.asset import AssetDownloader
+from bestdori_voice_extractor.downloader.verify import STATUSES, Verifier
 from bestdori_voice_extractor.downloader.voice import VoiceDownloader
-from bestdori_voice_extractor.merger import AssetMerger
+from bestdori_voice_extractor.locale import Locale
+from bestdori_voice_extractor.merger import FORMATS, merge_characters
+from bestdori_voice_extractor.metrics import metrics
+from bestdori_voice_extractor.pipeline import CharacterPipeline
+from bestdori_voice_extractor.service import ExtractionService
+from bestdori_voice_extractor.store import CatalogStore
+from bestdori_voice_extractor.transcode import Transcoder
 
-if __name__ == "__main__":
-    # Step 1: Download assets
-    asset_downloader = AssetDownloader("assets")
-    asset_downloader.run()
+MIRRORS = ("assets", "voices")
+
+
+def for_locales(fn, locales):
+    """
+    Run fn for every locale concurrently. The HTTP session, listing cache and voice pool are shared.
+    """
+    with ThreadPoolExecutor(max_workers=len(locales)) as executor:
+        for future in [executor.submit(fn, locale) for locale in locales]:
+            future.result()
+
+
+def output_dir(args: argparse.Namespace, locale: Locale) -> str:
+    # Several locales produce archives with the same names, keep them apart
+    return os.path.join(args.output_dir, str(locale)) if len(args.locale) > 1 else args.output_dir
+
+
+def pipeline(args: argparse.Namespace):
+    store = CatalogStore(CATALOG_PATH)
+
+    def run(locale: Locale):
+        assets, voices = locale_path("assets", locale), locale_path("voices", locale)
+
+        # Step 1: Download assets
+        asset_downloader = AssetDownloader(assets, locale=locale)
+        asset_downloader.run()
+
+        # Step 2: Download voices
+        voice_downloader = VoiceDownloader(voices, locale=locale)
+        voice_downloader.run()
+
+        # Step 3: Analyze assets
+        asset_analyzer = AssetAnalyzer(locale=locale)
+        asset_analyzer.run(assets, f"{locale_path('asset', locale)}.json", store=store)
+
+        # Step 4: Analyze voices
+        voice_analyzer = VoiceAnalyzer(locale=locale)
+        voice_analyzer.run(voices, f"{locale_path('voice', locale)}.json", store=store)
+
+    for_locales(run, args.locale)
+
+
+def merge(args: argparse.Namespace):
+    chara_ids = list(args.chara_ids)
+    if args.band is not None:
+        chara_ids += band_characters(args.band)
+    if not chara_ids:
+        console.print("[red]No character IDs given.")
+        return
+
+    compression = ZIP_DEFLATED if args.compress else ZIP_STORED
+    store = None if args.json else CatalogStore(args.store)
+    transcoder = Transcoder(sample_rate=args.sample_rate) if args.wav else None
+
+    def run(locale: Locale):
+        if args.json:
+            outputs = merge_characters(chara_ids, asset_json_path=args.json[0], voice_json_path=args.json[1],
+                                       output_dir=output_dir(args, locale), format=args.format,
+                                       compression=compression, max_workers=args.workers, locale=locale,
+                                       transcoder=transcoder)
+        else:
+            outputs = merge_characters(chara_ids, store, output_dir=output_dir(args, locale), format=args.format,
+                                       compression=compression, max_workers=args.workers, locale=locale,
+                                       transcoder=transcoder)
+        for chara_id, output_path in outputs.items():
+            console.print(f"[green]{chara_id}[/] ({locale}) -> {output_path}")
+
+    for_locales(run, args.locale)
+
+
+def dataset(args: argparse.Namespace):
+    chara_ids = list(args.chara_ids)
+    if args.band is not None:
+        chara_ids += band_characters(args.band)
+    # Without a filter the dataset holds every character, but a filter that matches nobody is a mistake
+    filtered = bool(args.chara_ids) or args.band is not None
+    if filtered and not chara_ids:
+        console.print("[red]No character IDs given.")
+        return
+    store = CatalogStore(args.store)
+    transcoder = Transcoder(sample_rate=args.sample_rate) if args.wav else None
 
-    # Step 2: Download voices
-    voice_downloader = VoiceDownloader("voices")
-    voice_downloader.run()
+    def run(locale: Locale):
+        builder = DatasetBuilder(store, locale, min_chars=args.min_chars, max_chars=args.max_chars,
+                                 min_seconds=args.min_seconds, max_seconds=args.max_seconds, dedup=not args.keep_duplicates,
+                                 validation=args.validation, shards=args.shards, seed=args.seed, transcoder=transcoder)
+        builder.build(output_dir(args, locale), chara_ids or None)
 
-    # Step 3: Analyze assets
-    asset_analyzer = AssetAnalyzer()
-    asset_analyzer.run("assets", "asset.json")
+    for_locales(run, args.locale)
 
-    # Step 4: Analyze voices
-    voice_analyzer = VoiceAnalyzer()
-    voice_analyzer.run("voices", "voice.json")
\ No newline at end of file
+
+def extract(args: argparse.Namespace):
+    def run(locale: Locale):
+        for chara_id in args.chara_ids:
+            CharacterPipeline(chara_id, locale=locale).run(output_dir(args, locale))
+
+    for_locales(run, args.locale)
+
+
+def mirror(value: str) -> str:
+    # argparse checks the default of a nargs="*" positional against its choices, so check here instead
+    if value not in MIRRORS:
+        raise argparse.ArgumentTypeError(f"invalid choice: {value!r} (choose from {', '.join(map(repr, MIRRORS))})")
+    return value
+
+
+def verify(args: argparse.Namespace):
+    reports = {}
+    mirrors = args.mirrors or MIRRORS
+
+    def run(locale: Locale):
+        downloaders = []
+        if "assets" in mirrors:
+            downloaders.append(AssetDownloader(locale_path("assets", locale), locale=locale))
+        if "voices" in mirrors:
+            downloaders.append(VoiceDownloader(locale_path("voices", locale), locale=locale))
+        for downloader in downloaders:
+            verifier = Verifier(downloader, deep=not args.quick)
+            report = verifier.run()
+            reports[downloader.save_path] = {
+                status: [downloader._path(*location) for location in report[status]] for status in STATUSES if status != "ok"
+            }
+            if args.repair:
+                verifier.repair(report)
+
+    for_locales(run, args.locale)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(reports, f, ensure_ascii=False, indent=4)
+
+
+def serve(args: argparse.Namespace):
+    service = ExtractionService(CatalogStore(args.store), args.output_dir, args.jobs, args.retention)
+    # Build the catalogs in the background, so that the first jobs do not wait for them
+    for locale in args.locale:
+        service.executor.submit(service.refresh, locale)
+    service.serve(args.host, args.port)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate voice datasets from Bestdori.")
+    parser.add_argument("--locale", type=Locale, choices=list(Locale), action="append",
+                        help=f"locale to process, may be repeated to process several concurrently (default: {CURRENT_LOCALE})")
+    parser.add_argument("--metrics", metavar="PATH", help="write metrics to PATH at the end, in Prometheus text format for .prom files and as JSON otherwise")
+    parser.add_argument("--profile", metavar="DIR", help="write a cProfile dump of every stage to DIR")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.add_parser("run", help="download and analyze all assets and voices (default)")
+
+    merge_parser = subparsers.add_parser("merge", help="merge several characters concurrently")
+    merge_parser.add_argument("chara_ids", nargs="*", help="character IDs to merge")
+    merge_parser.add_argument("--band", type=int, help="also merge every character of this band ID")
+    merge_parser.add_argument("--store", default=CATALOG_PATH, help="catalog store to read from")
+    merge_parser.add_argument("--json", nargs=2, metavar=("ASSET_JSON", "VOICE_JSON"), help="read JSON files instead of the store")
+    merge_parser.add_argument("--output-dir", default=".")
+    merge_parser.add_argument("--format", choices=FORMATS, default=MERGE_FORMAT)
+    merge_parser.add_argument("--compress", action="store_true", help="deflate zip entries")
+    merge_parser.add_argument("--workers", type=int, default=MAX_WORKERS)
+    merge_parser.add_argument("--wav", action="store_true", help="convert voices to trimmed, normalized mono WAV with ffmpeg")
+    merge_parser.add_argument("--sample-rate", type=int, default=TRANSCODE_SAMPLE_RATE, help="sample rate of converted voices")
+
+    dataset_parser = subparsers.add_parser("dataset", help="filter the catalog into train and validation .list shards")
+    dataset_parser.add_argument("chara_ids", nargs="*", help="character IDs to include (default: all)")
+    dataset_parser.add_argument("--band", type=int, help="also include every character of this band ID")
+    dataset_parser.add_argument("--store", default=CATALOG_PATH, help="catalog store to read from")
+    dataset_parser.add_argument("--output-dir", default="dataset")
+    dataset_parser.add_argument("--shards", type=int, default=DATASET_SHARDS, help="number of .list shards per split")
+    dataset_parser.add_argument("--validation", type=float, default=DATASET_VALIDATION, help="fraction of voice files in the validation split")
+    dataset_parser.add_argument("--seed", default="", help="changes which voice files go to the validation split")
+    dataset_parser.add_argument("--min-chars", type=int, default=1)
+    dataset_parser.add_argument("--max-chars", type=int)
+    dataset_parser.add_argument("--min-seconds", type=float)
+    dataset_parser.add_argument("--max-seconds", type=float)
+    dataset_parser.add_argument("--keep-duplicates", action="store_true", help="keep lines whose text the character already said")
+    dataset_parser.add_argument("--wav", action="store_true", help="convert voices to trimmed, normalized mono WAV with ffmpeg")
+    dataset_parser.add_argument("--sample-rate", type=int, default=TRANSCODE_SAMPLE_RATE, help="sample rate of converted voices")
+
+    extract_parser = subparsers.add_parser("extract", help="download and pack characters in one streaming pass")
+    extract_parser.add_argument("chara_ids", nargs="+", help="character IDs to extract")
+    extract_parser.add_argument("--output-dir", default=".")
+
+    verify_parser = subparsers.add_parser("verify", help="check local mirrors against the listings and the manifest")
+    verify_parser.add_argument("mirrors", nargs="*", type=mirror, metavar="{assets,voices}",
+                               help="mirrors to check, both by default")
+    verify_parser.add_argument("--quick", action="store_true", help="only check sizes, without hashing and decoding files")
+    verify_parser.add_argument("--repair", action="store_true", help="download again every file that failed")
+    verify_parser.add_argument("--report", metavar="PATH", help="write the files that failed to PATH as JSON")
+
+    serve_parser = subparsers.add_parser("serve", help="run extraction jobs submitted through a local HTTP API")
+    serve_parser.add_argument("--host", default=SERVICE_HOST)
+    serve_parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    serve_parser.add_argument("--jobs", type=int, default=SERVICE_JOBS, help="jobs run at the same time")
+    serve_parser.add_argument("--store", default=CATALOG_PATH, help="catalog store to keep the analyzed scenarios in")
+    serve_parser.add_argument("--output-dir", default=SERVICE_OUTPUT_DIR)
+    serve_parser.add_argument("--retention", type=float, default=SERVICE_RETENTION,
+                              help="seconds finished jobs and their output are kept")
+
+    args = parser.parse_args()
+    args.locale = list(dict.fromkeys(args.locale or [CURRENT_LOCALE]))
+    if args.profile:
+        metrics.profile_dir = args.profile
+    try:
+        if args.command == "merge":
+            merge(args)
+        elif args.command == "dataset":
+            dataset(args)
+        elif args.command == "verify":
+            verify(args)
+        elif args.command == "serve":
+            serve(args)
+        elif args.command == "extract":
+            extract(args)
+        else:
+            pipeline(args)
+    finally:
+        if args.metrics:
+            metrics.dump(args.metrics)
+
+
+if __name__ == "__main__":
+    main()
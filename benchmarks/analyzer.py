@@ -0,0 +1,48 @@
+"""
+Compare AssetAnalyzer in thread mode and in process mode with an increasing number of processes.
+
+    python -m benchmarks.analyzer --files 2000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.synthetic import write_scenarios
+from bestdori_voice_extractor.analyzer.asset import AssetAnalyzer
+
+
+def measure(dir_path: str, output: str, mode: str, processes: int = None) -> float:
+    start = time.perf_counter()
+    AssetAnalyzer(use_cache=False).run(dir_path, output, mode, processes)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        assets = os.path.join(tmp, "assets")
+        write_scenarios(assets, args.files)
+
+        baseline_output = os.path.join(tmp, "thread.json")
+        baseline = measure(assets, baseline_output, "thread")
+        rows = [("thread", "-", baseline)]
+
+        processes = 1
+        while processes <= (os.cpu_count() or 1):
+            output = os.path.join(tmp, f"process{processes}.json")
+            rows.append(("process", str(processes), measure(assets, output, "process", processes)))
+            with open(baseline_output, "rb") as a, open(output, "rb") as b:
+                assert a.read() == b.read(), f"process mode with {processes} processes differs from thread mode"
+            processes *= 2
+
+    print(f"{'mode':<8} {'procs':>5} {'seconds':>8} {'speedup':>8}")
+    for mode, procs, seconds in rows:
+        print(f"{mode:<8} {procs:>5} {seconds:>8.2f} {baseline / seconds:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
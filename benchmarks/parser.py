@@ -0,0 +1,57 @@
+"""
+Compare the scenario parsers of AssetAnalyzer by time and peak memory.
+
+    python -m benchmarks.parser --files 500
+"""
+import argparse
+import tempfile
+import time
+import tracemalloc
+from typing import List, Tuple
+
+from benchmarks.synthetic import write_scenarios
+from bestdori_voice_extractor.analyzer.asset import PARSERS, orjson, read_talks
+
+
+def measure(paths: List[str], parser: str) -> Tuple[float, int, List]:
+    start = time.perf_counter()
+    talks = [read_talks(path, parser) for path in paths]
+    seconds = time.perf_counter() - start
+
+    # Peak memory of parsing a single file, measured separately so that tracing does not skew the time
+    peak = 0
+    for path in paths[:20]:
+        tracemalloc.start()
+        read_talks(path, parser)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return seconds, peak, talks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=500)
+    parser.add_argument("--filler", type=int, default=200, help="size of the motion and layout data around talkData")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = write_scenarios(tmp, args.files, filler=args.filler)
+        rows = []
+        baseline, expected = None, None
+        for name in PARSERS:
+            if name == "orjson" and orjson is None:
+                print("orjson is not installed, skipping it")
+                continue
+            seconds, peak, talks = measure(paths, name)
+            if expected is None:
+                baseline, expected = seconds, talks
+            assert talks == expected, f"{name} parser differs from json"
+            rows.append((name, seconds, peak))
+
+    print(f"{'parser':<8} {'seconds':>8} {'speedup':>8} {'peak KiB':>9}")
+    for name, seconds, peak in rows:
+        print(f"{name:<8} {seconds:>8.2f} {baseline / seconds:>7.2f}x {peak / 1024:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
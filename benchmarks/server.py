@@ -0,0 +1,221 @@
+"""
+Serve a synthetic Bestdori asset tree on localhost, with configurable latency and error rate.
+
+    python -m benchmarks.server --scenarios 200 --latency 20 --error-rate 0.01
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import random
+import re
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+from benchmarks.synthetic import scenario
+
+# Scenarios whose voices share one voice directory
+VOICE_GROUP = 10
+LISTING = re.compile(r"^/api/explorer/[a-z]+/assets/(.+)\.json$")
+ASSET = re.compile(r"^/assets/[a-z]+/(.+)_rip/([^/]+)$")
+MP3_FRAME = b"\xff\xfb\x90\x64"
+
+
+class Tree:
+    """
+    Synthetic asset tree: scenarios in directories of per_dir files, and one voice file per talk.
+    Bodies are generated on request from the file index, so any scale fits in memory.
+    """
+
+    def __init__(self, scenarios: int = 200, per_dir: int = 100, talks: int = 40, filler: int = 200,
+                 voice_size: int = 16 * 1024):
+        self.scenarios = scenarios
+        self.per_dir = per_dir
+        self.talks = talks
+        self.filler = filler
+        self.voice_size = voice_size
+
+    def _dirs(self, size: int) -> int:
+        return (self.scenarios + size - 1) // size
+
+    def info(self) -> Dict:
+        return {
+            "scenario": {"eventstory": {f"event{d}": 0 for d in range(self._dirs(self.per_dir))}},
+            "sound": {"voice": {"scenario": {f"voice{d}": 0 for d in range(self._dirs(VOICE_GROUP))}}},
+        }
+
+    def characters(self) -> Dict:
+        return {str(i): {"characterName": [f"chara{i}"], "bandId": (i - 1) // 5 + 1} for i in range(1, 41)}
+
+    def listing(self, path: str) -> Optional[List[str]]:
+        if path == "_info":
+            return self.info()
+        match = re.fullmatch(r"scenario/eventstory/event(\d+)", path)
+        if match:
+            d = int(match[1])
+            return [f"scenario{i}.asset" for i in range(d * self.per_dir, min(self.scenarios, (d + 1) * self.per_dir))]
+        match = re.fullmatch(r"sound/voice/scenario/voice(\d+)", path)
+        if match:
+            d = int(match[1])
+            return [
+                f"scenario{i}-{t:03d}.mp3"
+                for i in range(d * VOICE_GROUP, min(self.scenarios, (d + 1) * VOICE_GROUP)) for t in range(self.talks)
+            ]
+        return None
+
+    def file(self, directory: str, name: str) -> Optional[bytes]:
+        match = re.fullmatch(r"scenario(\d+)\.asset", name)
+        if match and int(match[1]) < self.scenarios:
+            index = int(match[1])
+            body = scenario(index, self.talks, self.filler, random.Random(index))
+            return json.dumps(body, ensure_ascii=False).encode("utf-8")
+        match = re.fullmatch(r"scenario(\d+)-(\d+)\.mp3", name)
+        if match and int(match[1]) < self.scenarios and int(match[2]) < self.talks:
+            # An MPEG-1 Layer III frame header (128 kbps, 44.1 kHz), so that the files pass verification,
+            # and distinct payloads, so that the voice pool does not fold them into one blob
+            header = MP3_FRAME + name.encode()
+            return header + bytes(max(0, self.voice_size - len(header)))
+        return None
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    tree: Tree
+    latency: float
+    error_rate: float
+    stats: Dict[str, int]
+    lock: threading.Lock
+
+    def log_message(self, format, *args):
+        pass
+
+    def _count(self, key: str):
+        with self.lock:
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+    def _resolve(self) -> Tuple[int, bytes, str]:
+        if self.path == "/__stats__":
+            with self.lock:
+                return 200, json.dumps(self.stats).encode(), "application/json"
+        if self.path.startswith("/api/characters/"):
+            return 200, json.dumps(self.tree.characters()).encode(), "application/json"
+        match = LISTING.match(self.path)
+        if match:
+            data = self.tree.listing(match[1])
+            if data is not None:
+                self._count("listings")
+                return 200, json.dumps(data).encode(), "application/json"
+        match = ASSET.match(self.path)
+        if match:
+            body = self.tree.file(match[1], match[2])
+            if body is not None:
+                self._count("files")
+                return 200, body, "application/octet-stream"
+        return 404, b"", "text/plain"
+
+    def _respond(self, send_body: bool):
+        if self.path != "/__stats__":
+            if self.latency:
+                time.sleep(random.uniform(0.5, 1.5) * self.latency)
+            if random.random() < self.error_rate:
+                self._count("errors")
+                self.send_response(503)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+        status, body, content_type = self._resolve()
+        etag = f'"{hashlib.sha1(body).hexdigest()[:16]}"'
+        if status == 200 and self.headers.get("If-None-Match") == etag:
+            self._count("not_modified")
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def do_GET(self):
+        self._respond(True)
+
+    def do_HEAD(self):
+        self._respond(False)
+
+
+def serve(tree: Tree, port: int = 0, latency: float = 0.0, error_rate: float = 0.0, ready=None):
+    handler = type("Handler", (StandInHandler,), {
+        "tree": tree, "latency": latency, "error_rate": error_rate, "stats": {}, "lock": threading.Lock(),
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    if ready is not None:
+        ready.put(server.server_address[1])
+    server.serve_forever()
+
+
+class StandInServer:
+    """
+    Run the stand-in in a child process, so that it does not compete with the code under test for the GIL.
+
+        with StandInServer(Tree(scenarios=100), latency=0.02) as server:
+            point_at(server.url)
+    """
+    url: str
+
+    def __init__(self, tree: Tree, latency: float = 0.0, error_rate: float = 0.0):
+        self.tree = tree
+        self.latency = latency
+        self.error_rate = error_rate
+        self._process: Optional[multiprocessing.Process] = None
+
+    def __enter__(self) -> "StandInServer":
+        ready = multiprocessing.Queue()
+        self._process = multiprocessing.Process(
+            target=serve, args=(self.tree, 0, self.latency, self.error_rate, ready), daemon=True,
+        )
+        self._process.start()
+        self.url = f"http://127.0.0.1:{ready.get(timeout=30)}"
+        return self
+
+    def stats(self) -> Dict[str, int]:
+        with urllib.request.urlopen(f"{self.url}/__stats__") as response:
+            return json.loads(response.read())
+
+    def __exit__(self, *exc):
+        self._process.terminate()
+        self._process.join()
+
+
+def point_at(url: str):
+    """
+    Send all downloader requests to url instead of Bestdori.
+    """
+    import bestdori_voice_extractor.downloader as downloader
+
+    downloader.BESTDORI_HOST = url
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scenarios", type=int, default=200)
+    parser.add_argument("--talks", type=int, default=40)
+    parser.add_argument("--voice-size", type=int, default=16 * 1024)
+    parser.add_argument("--latency", type=float, default=0, help="average milliseconds added to every request")
+    parser.add_argument("--error-rate", type=float, default=0, help="fraction of requests answered with 503")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    tree = Tree(args.scenarios, talks=args.talks, voice_size=args.voice_size)
+    print(f"Serving {args.scenarios} scenarios on http://127.0.0.1:{args.port}, set BESTDORI_HOST to use it")
+    serve(tree, args.port, args.latency / 1000, args.error_rate)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""
+Benchmark every stage and the end-to-end cloud mode against a local Bestdori stand-in.
+
+    python -m benchmarks.stages --scenarios 200 --latency 20 --error-rate 0.01
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Callable, List, Optional, Tuple
+
+from benchmarks.server import StandInServer, Tree, point_at
+from bestdori_voice_extractor import console
+from bestdori_voice_extractor.analyzer.asset import AssetAnalyzer
+from bestdori_voice_extractor.analyzer.base import BaseAnalyzer
+from bestdori_voice_extractor.analyzer.voice import VoiceAnalyzer
+from bestdori_voice_extractor.config import MAX_WORKERS
+from bestdori_voice_extractor.downloader import session
+from bestdori_voice_extractor.downloader.asset import AssetDownloader
+from bestdori_voice_extractor.downloader.index import VoiceIndex
+from bestdori_voice_extractor.downloader.voice import VoiceDownloader
+from bestdori_voice_extractor.merger import AssetMerger
+from bestdori_voice_extractor.metrics import metrics
+from bestdori_voice_extractor.store import CatalogStore
+
+STAGES = ("download-assets", "analyze-assets", "download-voices", "analyze-voices", "merge", "cloud")
+
+
+@dataclass
+class Result:
+    stage: str
+    items: int = 0
+    bytes: int = 0
+    seconds: float = 0.0
+    # Per request for network stages, per file or character otherwise
+    latencies: List[float] = field(default_factory=list, repr=False)
+    peak_memory: Optional[int] = None
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def summary(self) -> dict:
+        data = asdict(self)
+        del data["latencies"]
+        data.update(p50=self.percentile(0.5), p99=self.percentile(0.99))
+        return data
+
+
+def disk_usage(dir_path: str, suffix: str) -> Tuple[int, int]:
+    count, size = 0, 0
+    for root, _, files in os.walk(dir_path):
+        for file in files:
+            if file.endswith(suffix):
+                count += 1
+                size += os.path.getsize(os.path.join(root, file))
+    return count, size
+
+
+def timed(analyzer: type, samples: List[float]) -> type:
+    """
+    Subclass an analyzer so that every parsed file records its parse time.
+    """
+    class Timed(analyzer):
+        @staticmethod
+        def _parse(file_path: str):
+            start = time.perf_counter()
+            try:
+                return analyzer._parse(file_path)
+            finally:
+                samples.append(time.perf_counter() - start)
+
+    return Timed
+
+
+class Bench:
+    """
+    Runs stages in order inside one working directory, so that later stages use what earlier ones produced.
+    """
+
+    def __init__(self, memory: bool = True):
+        self.memory = memory
+        self.results: List[Result] = []
+        self._requests: Optional[List[float]] = None
+        session.hooks["response"].append(self._record)
+
+    def _record(self, response, *args, **kwargs):
+        if self._requests is not None:
+            self._requests.append(response.elapsed.total_seconds())
+
+    def measure(self, stage: str, fn: Callable[[Result], None]) -> Result:
+        result = Result(stage)
+        self._requests = result.latencies
+        if self.memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            fn(result)
+        finally:
+            result.seconds = time.perf_counter() - start
+            if self.memory:
+                result.peak_memory = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            self._requests = None
+        self.results.append(result)
+        return result
+
+    @staticmethod
+    def download(downloader_cls: type, save_path: str, suffix: str) -> Callable[[Result], None]:
+        def run(result: Result):
+            downloader_cls(save_path).run()
+            result.items, result.bytes = disk_usage(save_path, suffix)
+        return run
+
+    @staticmethod
+    def analyze(analyzer_cls: type, dir_path: str, suffix: str, store: CatalogStore) -> Callable[[Result], None]:
+        def run(result: Result):
+            analyzer: BaseAnalyzer = timed(analyzer_cls, result.latencies)(use_cache=False)
+            analyzer.run(dir_path, store=store)
+            result.items, result.bytes = disk_usage(dir_path, suffix)
+        return run
+
+    @staticmethod
+    def merge(store: CatalogStore) -> Callable[[Result], None]:
+        def run(result: Result):
+            def merge_one(chara_id: int) -> str:
+                start = time.perf_counter()
+                output_path = AssetMerger(chara_id, store=store).merge("merged")
+                result.latencies.append(time.perf_counter() - start)
+                return output_path
+
+            with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+                outputs = list(executor.map(merge_one, store.characters()))
+            result.items = len(outputs)
+            result.bytes = sum(os.path.getsize(output_path) for output_path in outputs)
+        return run
+
+    @staticmethod
+    def cloud(chara_id: int) -> Callable[[Result], None]:
+        """
+        The cloud mode of interactive_extractor.py, from an empty directory.
+        """
+        def run(result: Result):
+            os.makedirs("cloud")
+            os.chdir("cloud")
+            try:
+                store = CatalogStore("catalog.db")
+                AssetDownloader("assets").run()
+                AssetAnalyzer(use_cache=False).run("assets", store=store)
+                wanted = {line["voice_file"] for line in store.lines(chara_id)}
+                downloader = VoiceDownloader("voices")
+                downloader.run(engine="async", plan=downloader.plan_voices(wanted, VoiceIndex("voice_index.db")))
+                VoiceAnalyzer(use_cache=False).run("voices", store=store)
+                output_path = AssetMerger(chara_id, store=store).merge()
+                result.items = len(wanted)
+                result.bytes = os.path.getsize(output_path)
+            finally:
+                os.chdir("..")
+        return run
+
+
+def report(results: List[Result]):
+    print(f"{'stage':<16} {'items':>7} {'seconds':>8} {'items/s':>9} {'MB/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'peak MiB':>9}")
+    for result in results:
+        p50, p99 = result.percentile(0.5), result.percentile(0.99)
+        print(
+            f"{result.stage:<16} {result.items:>7} {result.seconds:>8.2f} {result.items / result.seconds:>9.1f} "
+            f"{result.bytes / result.seconds / 1e6:>8.2f} "
+            f"{p50 * 1000 if p50 is not None else float('nan'):>8.1f} {p99 * 1000 if p99 is not None else float('nan'):>8.1f} "
+            f"{result.peak_memory / 2 ** 20 if result.peak_memory is not None else float('nan'):>9.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scenarios", type=int, default=200)
+    parser.add_argument("--talks", type=int, default=40)
+    parser.add_argument("--voice-size", type=int, default=16 * 1024)
+    parser.add_argument("--latency", type=float, default=0, help="average milliseconds added to every request")
+    parser.add_argument("--error-rate", type=float, default=0, help="fraction of requests answered with 503")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--chara", type=int, default=1, help="character extracted by the cloud stage")
+    parser.add_argument("--no-memory", action="store_true", help="skip tracemalloc, which slows down parsing")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    console.quiet = True
+    tree = Tree(args.scenarios, talks=args.talks, voice_size=args.voice_size)
+    with StandInServer(tree, args.latency / 1000, args.error_rate) as server, tempfile.TemporaryDirectory() as tmp:
+        point_at(server.url)
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            bench = Bench(memory=not args.no_memory)
+            store = CatalogStore("catalog.db")
+            stages = {
+                "download-assets": bench.download(AssetDownloader, "assets", ".asset"),
+                "analyze-assets": bench.analyze(AssetAnalyzer, "assets", ".asset", store),
+                "download-voices": bench.download(VoiceDownloader, "voices", ".mp3"),
+                "analyze-voices": bench.analyze(VoiceAnalyzer, "voices", ".mp3", store),
+                "merge": bench.merge(store),
+                "cloud": bench.cloud(args.chara),
+            }
+            for stage in args.stages:
+                bench.measure(stage, stages[stage])
+            store.close()
+        finally:
+            os.chdir(cwd)
+        server_stats = server.stats()
+
+    report(bench.results)
+    print(f"server: {server_stats}")
+    print(f"requests: {metrics.total('http_requests_total'):g}, retries: {metrics.total('http_retries_total'):g}, "
+          f"errors: {metrics.total('http_errors_total'):g}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({
+                "results": [result.summary() for result in bench.results],
+                "server": server_stats,
+                "metrics": metrics.snapshot(),
+            }, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+import json
+import os
+import random
+from typing import Dict, List
+
+
+def scenario(index: int, talks: int, filler: int, rng: random.Random) -> Dict:
+    """
+    Build a scenario asset shaped like Bestdori's, with filler motion and layout data around talkData.
+    """
+    return {
+        "Base": {
+            "scenarioSceneId": f"scenario{index}",
+            "talkData": [
+                {
+                    "windowDisplayName": "",
+                    "body": f"line {index}-{i}\n{'あ' * rng.randint(5, 40)}",
+                    "voices": [
+                        {"characterId": rng.randint(1, 40), "voiceId": f"scenario{index}-{i:03d}", "volume": 1.0}
+                        for _ in range(rng.choice((1, 1, 1, 2)))
+                    ],
+                    "motions": [{"characterId": 1, "motionName": "idle01", "delay": 0.0}] * 3,
+                }
+                for i in range(talks)
+            ],
+            "layoutData": [{"type": 1, "sideFrom": 1, "sideTo": 2, "costumeType": "default"}] * filler,
+            "specialEffectData": [{"effectType": 8, "stringVal": "x" * 32, "duration": 0.5}] * filler,
+        }
+    }
+
+
+def write_scenarios(dir_path: str, files: int, talks: int = 40, filler: int = 200, seed: int = 0) -> List[str]:
+    """
+    Write synthetic .asset files into dir_path, spread over directories of 100 files.
+    """
+    rng = random.Random(seed)
+    paths = []
+    for index in range(files):
+        directory = os.path.join(dir_path, "scenario", f"event{index // 100}")
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"scenario{index}.asset")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(scenario(index, talks, filler, rng), f, ensure_ascii=False)
+        paths.append(path)
+    return paths
@@ -1,15 +1,64 @@
 import json
-from dataclasses import dataclass
-from typing import Dict, List
+import re
+from array import array
+from typing import Dict, Iterator, List, Tuple
 
-from bestdori_voice_extractor import console
 from bestdori_voice_extractor.analyzer.base import BaseAnalyzer
+from bestdori_voice_extractor.analyzer.table import StringTable
+from bestdori_voice_extractor.config import ASSET_PARSER
+from bestdori_voice_extractor.store import CatalogStore
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+PARSERS = ("json", "skim", "orjson")
+_TALK_DATA = re.compile(r'"talkData"\s*:\s*')
+_decoder = json.JSONDecoder()
+
+
+def read_talks(file_path: str, parser: str = ASSET_PARSER) -> List[Dict]:
+    """
+    Return Base.talkData of a scenario.
+
+    "json" decodes the whole file. "skim" decodes only the talkData array and skips the motion,
+    layout and effect data around it, falling back to the whole file if the array is not found.
+    "orjson" decodes the whole file with orjson if it is installed and skims otherwise.
+    """
+    if parser not in PARSERS:
+        raise ValueError(f"Unknown parser {parser!r}, expected one of {PARSERS}")
+    if parser == "orjson" and orjson is not None:
+        with open(file_path, "rb") as f:
+            return orjson.loads(f.read())["Base"]["talkData"]
+
+    with open(file_path, "r", encoding="utf-8") as f:
+        if parser == "json":
+            return json.load(f)["Base"]["talkData"]
+        content = f.read()
+    match = _TALK_DATA.search(content)
+    if match:
+        try:
+            talks, _ = _decoder.raw_decode(content, match.end())
+            if isinstance(talks, list):
+                return talks
+        except ValueError:
+            pass
+    return json.loads(content)["Base"]["talkData"]
 
 
-@dataclass
 class Asset:
-    text: str
-    voice_file: str
+    __slots__ = ("text", "voice_file")
+
+    def __init__(self, text: str, voice_file: str):
+        self.text = text
+        self.voice_file = voice_file
+
+    def __eq__(self, other):
+        return isinstance(other, Asset) and (self.text, self.voice_file) == (other.text, other.voice_file)
+
+    def __repr__(self):
+        return f"Asset(text={self.text!r}, voice_file={self.voice_file!r})"
 
     def __json__(self):
         return {
@@ -17,44 +66,91 @@ class Asset:
             "voice_file": self.voice_file
         }
 
+class _Lines:
+    """
+    Lines of one character, materialized only while they are being encoded.
+    """
+    __slots__ = ("assets", "character_id")
+
+    def __init__(self, assets: "AssetDict", character_id: int):
+        self.assets = assets
+        self.character_id = character_id
+
+    def __json__(self):
+        return [asset.__json__() for asset in self.assets[self.character_id]]
+
 class AssetDict:
+    """
+    Lines per character, stored as arrays of IDs into one table of texts and voice IDs.
+    A line is 8 bytes, and a text shared by several voices or lines is stored once.
+    """
+
     def __init__(self):
-        self._data: Dict[int, List[Asset]] = {}
+        self._strings = StringTable()
+        # Character ID -> (text IDs, voice IDs)
+        self._data: Dict[int, Tuple[array, array]] = {}
     
     def add(self, character_id: int, asset: Asset):
-        if character_id in self._data:
-            self._data[character_id].append(asset)
-        else:
-            self._data[character_id] = [asset]
+        columns = self._data.get(character_id)
+        if columns is None:
+            columns = self._data[character_id] = (array("I"), array("I"))
+        columns[0].append(self._strings.intern(asset.text))
+        columns[1].append(self._strings.intern(asset.voice_file))
 
     def __getitem__(self, character_id: int) -> List[Asset]:
-        return self._data[character_id]
+        texts, voices = self._data[character_id]
+        return [Asset(self._strings[text], self._strings[voice]) for text, voice in zip(texts, voices)]
     
     def __iter__(self):
         return iter(self._data)
 
     def __len__(self):
         return len(self._data)
+
+    def rows(self) -> Iterator[Tuple[int, str, str]]:
+        """
+        Yield (character_id, text, voice_file) for every line without building Asset objects.
+        """
+        for character_id, (texts, voices) in self._data.items():
+            for text, voice in zip(texts, voices):
+                yield character_id, self._strings[text], self._strings[voice]
     
     def __json__(self):
-        return self._data
+        return {character_id: _Lines(self, character_id) for character_id in self._data}
 
 class AssetAnalyzer(BaseAnalyzer):
     """
     Analyzer for asset files.
     """
     data: AssetDict
+    EXTENSIONS = (".asset",)
 
-    def __init__(self) -> None:
-        super().__init__()
+    def __init__(self, **kwargs) -> None:
+        super().__init__(**kwargs)
         self.data = AssetDict()
     
-    def _analyze(self, file_path: str):
-        console.print(f"Analyzing [yellow]{file_path}")
-        with open(file_path, "r", encoding="utf-8") as f:
-            talks = json.load(f)["Base"]["talkData"]
-            for talk in talks:
-                # Remove newline characters
-                text = talk["body"].replace("\n", "")
-                for voice in talk["voices"]:
-                    self.data.add(voice["characterId"], Asset(text, voice["voiceId"]))
\ No newline at end of file
+    @staticmethod
+    def _parse(file_path: str) -> Dict[int, List[Asset]]:
+        lines: Dict[int, List[Asset]] = {}
+        for talk in read_talks(file_path):
+            # Remove newline characters
+            text = talk["body"].replace("\n", "")
+            for voice in talk["voices"]:
+                lines.setdefault(voice["characterId"], []).append(Asset(text, voice["voiceId"]))
+        return lines
+
+    @staticmethod
+    def _decode(encoded: str) -> Dict[int, List[Asset]]:
+        return {
+            int(character_id): [Asset(**asset) for asset in assets]
+            for character_id, assets in json.loads(encoded).items()
+        }
+
+    def _collect(self, file_path: str, result: Dict[int, List[Asset]]):
+        for character_id, assets in result.items():
+            for asset in assets:
+                self.data.add(character_id, asset)
+
+
+    def save(self, store: CatalogStore):
+        store.put_lines(self.data.rows(), self.locale)
\ No newline at end of file
@@ -1,10 +1,19 @@
 import json
 import os
 from abc import ABC, abstractmethod
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
 
 from bestdori_voice_extractor import console
-from bestdori_voice_extractor.config import MAX_WORKERS
+from bestdori_voice_extractor.analyzer.cache import AnalysisCache
+from bestdori_voice_extractor.config import ANALYSIS_CACHE_PATH, ANALYZER_MODE, CURRENT_LOCALE, MAX_WORKERS
+from bestdori_voice_extractor.locale import Locale
+from bestdori_voice_extractor.metrics import metrics
+from bestdori_voice_extractor.store import CatalogStore
+
+MODES = ("thread", "process")
+# Number of files handed to a worker thread or process at once
+BATCH_SIZE = 64
 
 
 def _dumper(obj):
@@ -16,39 +25,209 @@ def dumps(obj, *args, **kwargs):
     return json.dumps(obj, default=_dumper, *args, **kwargs)
 
 
+def _try_parse(parse: Callable[[str], object], file_path: str) -> Optional[object]:
+    try:
+        return parse(file_path)
+    except Exception as e:
+        console.print(f"[red]Failed to analyze {file_path}[/]: {e}")
+        return None
+
+def _parse_batch(parse: Callable[[str], object], files: List[str]) -> List[Optional[object]]:
+    return [_try_parse(parse, file_path) for file_path in files]
+
+def _under(file_path: str, root: str) -> bool:
+    relative = os.path.relpath(file_path, root)
+    return relative != os.pardir and not relative.startswith(os.pardir + os.sep)
+
+
 class BaseAnalyzer(ABC):
     """
     Base class for analyzers.
     """
     data: object
     executor: ThreadPoolExecutor
+    cache: Optional[AnalysisCache]
+    locale: Locale
+    # Name of the analyzer in metrics and progress
+    stage: str
+    # Extensions of the files to analyze, None for all files
+    EXTENSIONS: Optional[Tuple[str, ...]] = None
 
-    def __init__(self):
+    def __init__(self, cache: Optional[AnalysisCache] = None, use_cache: bool = True, locale: Locale = CURRENT_LOCALE):
+        self.locale = Locale(locale)
+        self.stage = f"analyze {type(self).__name__}"
         self.executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+        self.cache = cache or (AnalysisCache(ANALYSIS_CACHE_PATH) if use_cache else None)
 
-    def walk(self, dir_path: str):
+    def _scan(self, dir_path: str) -> Tuple[List[str], List[str]]:
         """
-        Walk through the directory and analyze the files.
+        List the wanted files and the subdirectories of one directory, both sorted by name.
         """
-        for root, dirs, files in os.walk(dir_path):
-            for dir in dirs:
-                self.walk(dir)
-            for file in files:
-                file_path = os.path.join(root, file)
-                self.executor.submit(self._analyze, file_path)
+        files, dirs = [], []
+        try:
+            with os.scandir(dir_path) as it:
+                for entry in it:
+                    # Like os.walk, symlinks to directories are not followed
+                    if entry.is_dir():
+                        if not entry.is_symlink():
+                            dirs.append(entry.name)
+                    elif not entry.name.endswith(".part") and (
+                        self.EXTENSIONS is None or entry.name.endswith(self.EXTENSIONS)
+                    ):
+                        files.append(entry.name)
+        except OSError:
+            return [], []
+        return (
+            [os.path.join(dir_path, file) for file in sorted(files)],
+            [os.path.join(dir_path, directory) for directory in sorted(dirs)],
+        )
 
+    def walk(self, dir_path: str) -> List[str]:
+        """
+        Walk through the directory and return the files to analyze in the order of a sorted os.walk.
+        Each level of the tree is scanned concurrently, so large trees are not listed one directory at a time.
+        """
+        scanned: Dict[str, Tuple[List[str], List[str]]] = {}
+        level = [dir_path]
+        while level:
+            results = list(self.executor.map(self._scan, level))
+            scanned.update(zip(level, results))
+            level = [directory for _, dirs in results for directory in dirs]
+
+        # Files of a directory come before those of its subdirectories, as with os.walk
+        file_paths = []
+        stack = [dir_path]
+        while stack:
+            files, dirs = scanned[stack.pop()]
+            file_paths.extend(files)
+            stack.extend(reversed(dirs))
+        return file_paths
+
+    @staticmethod
     @abstractmethod
-    def _analyze(self, file_path: str):
+    def _parse(file_path: str) -> object:
+        """
+        Parse a single file. Runs in a worker thread or process, so it must not touch the analyzer.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def _collect(self, file_path: str, result: object):
+        """
+        Add the result of _parse to the analyzer data. Always runs in the calling thread.
+        """
         raise NotImplementedError
-    
+
+    @staticmethod
+    def _encode(result: object) -> str:
+        return dumps(result, ensure_ascii=False)
+
+    @staticmethod
+    def _decode(encoded: str) -> object:
+        """
+        Turn a cached result back into what _parse returned.
+        """
+        return json.loads(encoded)
+
+    def _analyze(self, file_path: str):
+        result = _try_parse(self._parse, file_path)
+        if result is not None:
+            self._collect(file_path, result)
+
+    def parse(self, file_paths: List[str], mode: str = ANALYZER_MODE, processes: Optional[int] = None) -> List[Optional[object]]:
+        """
+        Parse the files in batches on the thread pool or on a process pool.
+        Returns the results in the order of file_paths, None for files that failed.
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown mode {mode!r}, expected one of {MODES}")
+
+        parse = type(self)._parse
+        batches = [file_paths[i:i + BATCH_SIZE] for i in range(0, len(file_paths), BATCH_SIZE)]
+        results = []
+
+        def collect(batch_results):
+            for batch in batch_results:
+                results.extend(batch)
+                metrics.advance(self.stage, len(batch))
+
+        if mode == "thread":
+            collect(self.executor.map(_parse_batch, [parse] * len(batches), batches))
+        else:
+            with ProcessPoolExecutor(max_workers=processes) as pool:
+                collect(pool.map(_parse_batch, [parse] * len(batches), batches))
+        failed = results.count(None)
+        metrics.inc("analyzed_files_total", len(results) - failed, stage=self.stage, source="parsed")
+        metrics.inc("analyzed_files_total", failed, stage=self.stage, source="failed")
+        return results
+
+    def analyze(self, file_paths: List[str], mode: str = ANALYZER_MODE, processes: Optional[int] = None,
+                root: Optional[str] = None):
+        """
+        Collect the results of all files in the order of file_paths.
+        With a cache, only files added or changed since the last run are parsed. Cached files missing
+        from file_paths are dropped if they are below root, the directory file_paths were walked from,
+        or without a root if they no longer exist, so that other directories keep their entries.
+        """
+        if self.cache is None:
+            results = self.parse(file_paths, mode, processes)
+        else:
+            # Locales are analyzed from different directories, keep their results apart
+            analyzer = f"{type(self).__name__}:{self.locale}"
+            cached = self.cache.load(analyzer)
+            stats = {file_path: os.stat(file_path) for file_path in file_paths}
+            stale = [
+                file_path for file_path in file_paths
+                if cached.get(file_path, (None, None))[:2] != (stats[file_path].st_mtime_ns, stats[file_path].st_size)
+            ]
+            console.print(f"Parsing [yellow]{len(stale)}[/] new or changed of {len(file_paths)} files...")
+            metrics.inc("analyzed_files_total", len(file_paths) - len(stale), stage=self.stage, source="cached")
+            metrics.advance(self.stage, len(file_paths) - len(stale))
+
+            fresh = dict(zip(stale, self.parse(stale, mode, processes)))
+            removed = [
+                file_path for file_path in cached
+                if file_path not in stats and (_under(file_path, root) if root is not None else not os.path.exists(file_path))
+            ]
+            self.cache.update(analyzer, (
+                (file_path, stats[file_path].st_mtime_ns, stats[file_path].st_size, self._encode(result))
+                for file_path, result in fresh.items() if result is not None
+            ), removed)
+            results = [
+                fresh[file_path] if file_path in fresh else self._decode(cached[file_path][2])
+                for file_path in file_paths
+            ]
+
+        for file_path, result in zip(file_paths, results):
+            if result is not None:
+                self._collect(file_path, result)
+
     def dump(self, file_path: str):
+        # json.dump encodes in chunks instead of building the whole document in memory
         with open(file_path, "w", encoding="utf-8") as f:
-            f.write(dumps(self.data, ensure_ascii=False, indent=4))
-    
-    def run(self, dir_path: str, file_path: str):
+            json.dump(self.data, f, default=_dumper, ensure_ascii=False, indent=4)
+
+    @abstractmethod
+    def save(self, store: CatalogStore):
+        """
+        Write the analyzer data into the indexed store under the analyzer locale.
+        """
+        raise NotImplementedError
+
+    def run(self, dir_path: str, file_path: Optional[str] = None, mode: str = ANALYZER_MODE,
+            processes: Optional[int] = None, store: Optional[CatalogStore] = None):
+        """
+        Analyze dir_path and write the result to the store and/or as JSON to file_path.
+        """
         console.print("[yellow bold]Launching analyzing...")
-        self.walk(dir_path)
-        console.print("[yellow]Shutting down executor...")
-        self.executor.shutdown()
-        self.dump(file_path)
+        self.stage = f"analyze {dir_path}"
+        file_paths = self.walk(dir_path)
+        with metrics.stage(self.stage, len(file_paths)):
+            self.analyze(file_paths, mode, processes, dir_path)
+            console.print("[yellow]Shutting down executor...")
+            self.executor.shutdown()
+        if store is not None:
+            self.save(store)
+        if file_path is not None:
+            self.dump(file_path)
         console.print("[green bold]Analyze complete!")
@@ -0,0 +1,53 @@
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Tuple
+
+# (mtime_ns, size, encoded result)
+CacheEntry = Tuple[int, int, str]
+
+
+class AnalysisCache:
+    """
+    SQLite cache of per-file analysis results, keyed by path and validated by mtime and size.
+    """
+    db_path: str
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "analyzer TEXT NOT NULL, path TEXT NOT NULL, mtime_ns INTEGER NOT NULL, size INTEGER NOT NULL, "
+                "result TEXT NOT NULL, PRIMARY KEY (analyzer, path))"
+            )
+
+    def load(self, analyzer: str) -> Dict[str, CacheEntry]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path, mtime_ns, size, result FROM results WHERE analyzer = ?", (analyzer,)
+            ).fetchall()
+        return {path: (mtime_ns, size, result) for path, mtime_ns, size, result in rows}
+
+    def update(self, analyzer: str, entries: Iterable[Tuple[str, int, int, str]], removed: List[str]):
+        """
+        Store fresh results and drop the results of files that no longer exist, in one transaction.
+        """
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                ((analyzer, path, mtime_ns, size, result) for path, mtime_ns, size, result in entries),
+            )
+            self._conn.executemany(
+                "DELETE FROM results WHERE analyzer = ? AND path = ?", ((analyzer, path) for path in removed)
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,24 @@
+from typing import Dict, List
+
+
+class StringTable:
+    """
+    Interned strings addressed by integer IDs, so that repeated texts and paths are stored once.
+    """
+
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self._strings: List[str] = []
+
+    def intern(self, string: str) -> int:
+        string_id = self._ids.get(string)
+        if string_id is None:
+            string_id = self._ids[string] = len(self._strings)
+            self._strings.append(string)
+        return string_id
+
+    def __getitem__(self, string_id: int) -> str:
+        return self._strings[string_id]
+
+    def __len__(self):
+        return len(self._strings)
\ No newline at end of file
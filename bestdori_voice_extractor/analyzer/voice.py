@@ -1,20 +1,79 @@
 import os
-from typing import Dict
+from collections.abc import MutableMapping
+from typing import Dict, Iterator
 
 # from bestdori_voice_extractor import console
 from bestdori_voice_extractor.analyzer.base import BaseAnalyzer
+from bestdori_voice_extractor.analyzer.table import StringTable
+from bestdori_voice_extractor.store import CatalogStore
+
+
+class VoiceDict(MutableMapping):
+    """
+    Mapping from voice ID to file path that stores each directory and extension once.
+    Paths are rebuilt from the ID, so an entry costs an integer instead of a full path.
+    """
+
+    def __init__(self):
+        self._locations = StringTable()
+        # Voice ID -> ID of its (directory, extension) in _locations
+        self._data: Dict[str, int] = {}
+        # Paths that cannot be rebuilt from their voice ID
+        self._other: Dict[str, str] = {}
+
+    def __setitem__(self, voice_id: str, file_path: str):
+        directory, file = os.path.split(file_path)
+        stem, extension = os.path.splitext(file)
+        self._data.pop(voice_id, None)
+        self._other.pop(voice_id, None)
+        if stem == voice_id and os.path.join(directory, file) == file_path:
+            self._data[voice_id] = self._locations.intern(f"{directory}\0{extension}")
+        else:
+            self._other[voice_id] = file_path
+
+    def __getitem__(self, voice_id: str) -> str:
+        location = self._data.get(voice_id)
+        if location is None:
+            return self._other[voice_id]
+        directory, extension = self._locations[location].split("\0")
+        return os.path.join(directory, voice_id + extension)
+
+    def __delitem__(self, voice_id: str):
+        if self._data.pop(voice_id, None) is None:
+            del self._other[voice_id]
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self._data
+        yield from self._other
+
+    def __len__(self):
+        return len(self._data) + len(self._other)
+
+    def __contains__(self, voice_id) -> bool:
+        return voice_id in self._data or voice_id in self._other
+
+    def __json__(self):
+        return dict(self.items())
 
 
 class VoiceAnalyzer(BaseAnalyzer):
     """
     Analyzer for asset files.
     """
-    data: Dict[str, str]
+    data: VoiceDict
+    EXTENSIONS = (".mp3",)
 
-    def __init__(self) -> None:
-        super().__init__()
-        self.data = {}
+    def __init__(self, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.data = VoiceDict()
     
-    def _analyze(self, file_path: str):
+    @staticmethod
+    def _parse(file_path: str) -> str:
         # console.print(f"Analyzing [yellow]{file_path}")
-        self.data[os.path.splitext(os.path.basename(file_path))[0]] = file_path
\ No newline at end of file
+        return os.path.splitext(os.path.basename(file_path))[0]
+
+    def _collect(self, file_path: str, result: str):
+        self.data[result] = file_path
+
+    def save(self, store: CatalogStore):
+        store.put_voices(self.data.items(), self.locale)
\ No newline at end of file
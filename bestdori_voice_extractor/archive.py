@@ -0,0 +1,203 @@
+import mmap
+import os
+import struct
+import sys
+import tarfile
+import zlib
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
+from zipfile import ZIP_STORED, BadZipFile, ZipFile
+
+# Fixed part of a zip local file header, followed by the file name and the extra field
+LOCAL_HEADER = struct.Struct("<4s5H3L2H")
+LOCAL_SIGNATURE = b"PK\x03\x04"
+# Views tracked before the ones nobody holds any more are dropped
+VIEWS_PRUNE_AT = 1024
+
+
+class Entry(NamedTuple):
+    voice_id: str
+    # Name of the voice file in the archive
+    name: str
+    # Row of the .list, in the same "name|chara_id|locale|text" form the merger writes
+    row: str
+    data: Union[memoryview, bytes]
+
+
+class Member(NamedTuple):
+    offset: int
+    size: int
+    # Zip entries only: CRC-32 and whether the data is stored uncompressed
+    crc: Optional[int]
+    stored: bool
+
+
+class ArchiveReader:
+    """
+    Reads a .zip or .tar written by AssetMerger without extracting it.
+
+    The archive is memory-mapped, and the data of every stored entry is returned as a zero-copy
+    memoryview into the map, so loaders and checks read voices straight from the page cache.
+    Compressed zip entries (merge(compression=ZIP_DEFLATED)) are decompressed into bytes instead.
+    Closing the reader releases every view it handed out, so copy the data that must outlive it.
+
+        with ArchiveReader("36.zip") as archive:
+            for entry in archive:
+                load(entry.data, entry.row)
+    """
+    path: str
+    chara_id: str
+    rows: List[str]
+    members: Dict[str, Member]
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f"{path} is empty")
+        self._zipf: Optional[ZipFile] = None
+        # Views handed out and possibly still held, released on close since the map cannot be closed while they are alive
+        self._views: List[memoryview] = []
+        self._prune_at = VIEWS_PRUNE_AT
+        try:
+            if path.endswith(".tar"):
+                self.members, list_data = self._read_tar()
+            else:
+                self.members, list_data = self._read_zip()
+        except BaseException:
+            self.close()
+            raise
+        if list_data is None:
+            self.close()
+            raise ValueError(f"{path} holds no .list")
+
+        self.rows = list_data.decode("utf-8").splitlines()
+        # Voice ID -> name in the archive and rows using it, in the order of the .list
+        self._names: Dict[str, str] = {}
+        self._rows: Dict[str, List[str]] = {}
+        for row in self.rows:
+            name = row.split("|", 1)[0]
+            voice_id = os.path.splitext(name)[0]
+            self._names.setdefault(voice_id, name)
+            self._rows.setdefault(voice_id, []).append(row)
+
+    def _read_zip(self) -> Tuple[Dict[str, Member], Optional[bytes]]:
+        self._zipf = ZipFile(self._file)
+        members = {}
+        list_data = None
+        for info in self._zipf.infolist():
+            if info.filename.endswith(".list"):
+                self.chara_id = info.filename[:-len(".list")]
+                list_data = self._zipf.read(info)
+                continue
+            # The central directory does not give the length of the local extra field, read it from the local header
+            header = LOCAL_HEADER.unpack_from(self._mm, info.header_offset)
+            if header[0] != LOCAL_SIGNATURE:
+                raise ValueError(f"Bad local header of {info.filename} in {self.path}")
+            offset = info.header_offset + LOCAL_HEADER.size + header[9] + header[10]
+            members[info.filename] = Member(offset, info.compress_size, info.CRC, info.compress_type == ZIP_STORED)
+        return members, list_data
+
+    def _read_tar(self) -> Tuple[Dict[str, Member], Optional[bytes]]:
+        members = {}
+        list_data = None
+        with tarfile.open(fileobj=self._file, mode="r:") as tarf:
+            for info in tarf:
+                if not info.isfile():
+                    continue
+                if info.name.endswith(".list"):
+                    self.chara_id = info.name[:-len(".list")]
+                    list_data = self._mm[info.offset_data:info.offset_data + info.size]
+                    continue
+                members[info.name] = Member(info.offset_data, info.size, None, True)
+        return members, list_data
+
+    def _data(self, name: str) -> Union[memoryview, bytes]:
+        member = self.members[name]
+        if member.stored:
+            view = memoryview(self._mm)[member.offset:member.offset + member.size]
+            self._track(view)
+            return view
+        return self._zipf.read(name)
+
+    def _track(self, view: memoryview):
+        self._views.append(view)
+        if len(self._views) >= self._prune_at:
+            # A view referred to only by the list, the loop and getrefcount is no longer held by the caller.
+            # Dropping it frees its export of the map, so the list stays as long as the views in use.
+            self._views = [held for held in self._views if sys.getrefcount(held) > 3]
+            self._prune_at = max(VIEWS_PRUNE_AT, 2 * len(self._views))
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def __contains__(self, voice_id) -> bool:
+        return voice_id in self._names
+
+    def __getitem__(self, voice_id: str) -> Union[memoryview, bytes]:
+        """
+        Data of the voice file of a voice ID.
+        """
+        return self._data(self._names[voice_id])
+
+    def voice_ids(self) -> List[str]:
+        """
+        Voice IDs in the order they first appear in the .list.
+        """
+        return list(self._names)
+
+    def rows_of(self, voice_id: str) -> List[str]:
+        """
+        Rows of the .list that use a voice file, in order.
+        """
+        return list(self._rows[voice_id])
+
+    def __iter__(self) -> Iterator[Entry]:
+        """
+        Yield every row of the .list with the data of its voice file, in order.
+        Rows whose voice file is not in the archive are skipped.
+        """
+        for row in self.rows:
+            name = row.split("|", 1)[0]
+            if name in self.members:
+                yield Entry(os.path.splitext(name)[0], name, row, self._data(name))
+
+    def check(self) -> List[str]:
+        """
+        Return the names of zip entries whose data does not match their CRC-32.
+        Tar archives hold no checksums of their data, so nothing is reported for them.
+        """
+        bad = []
+        for name, member in self.members.items():
+            if member.crc is None:
+                continue
+            if not member.stored:
+                # Reading a compressed entry checks its CRC-32 after decompression
+                try:
+                    self._zipf.read(name)
+                except (BadZipFile, zlib.error):
+                    bad.append(name)
+                continue
+            with memoryview(self._mm)[member.offset:member.offset + member.size] as view:
+                if zlib.crc32(view) != member.crc:
+                    bad.append(name)
+        return bad
+
+    def close(self):
+        for view in self._views:
+            view.release()
+        self._views.clear()
+        if self._zipf is not None:
+            self._zipf.close()
+            self._zipf = None
+        if not self._mm.closed:
+            self._mm.close()
+        self._file.close()
+
+    def __enter__(self) -> "ArchiveReader":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
\ No newline at end of file
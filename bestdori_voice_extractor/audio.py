@@ -0,0 +1,89 @@
+import os
+import struct
+import wave
+from typing import Optional
+
+# Bitrates in kbps by bitrate index, for MPEG-1 and MPEG-2/2.5 Layer III
+BITRATES = {
+    1: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+# Sample rates by version bits and sample rate index
+SAMPLE_RATES = {
+    3: (44100, 48000, 32000),
+    2: (22050, 24000, 16000),
+    0: (11025, 12000, 8000),
+}
+# Bytes of the start of an mp3 searched for the first frame
+HEAD_SIZE = 64 * 1024
+
+
+def _id3_size(head: bytes) -> int:
+    """
+    Size of a leading ID3v2 tag, whose length is stored as a syncsafe integer.
+    """
+    if len(head) < 10 or head[:3] != b"ID3":
+        return 0
+    size = 0
+    for byte in head[6:10]:
+        size = (size << 7) | (byte & 0x7F)
+    # A footer repeats the header at the end of the tag
+    return 10 + size + (10 if head[5] & 0x10 else 0)
+
+
+def mp3_seconds(path: str) -> Optional[float]:
+    """
+    Duration of an MPEG Layer III file from its first frame header, without decoding it.
+    VBR files are measured by the frame count of their Xing or Info header, others by their bitrate.
+    Returns None if no valid frame is found.
+    """
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        # Offset in the file of the bytes searched, which start after the ID3 tag
+        base = _id3_size(f.read(10))
+        f.seek(base)
+        head = f.read(HEAD_SIZE)
+
+    for i in range(len(head) - 4):
+        if head[i] != 0xFF or head[i + 1] & 0xE0 != 0xE0:
+            continue
+        version = (head[i + 1] >> 3) & 3
+        layer = (head[i + 1] >> 1) & 3
+        bitrate_index = head[i + 2] >> 4
+        rate_index = (head[i + 2] >> 2) & 3
+        if version == 1 or layer != 1 or bitrate_index in (0, 15) or rate_index == 3:
+            continue
+        mpeg1 = version == 3
+        sample_rate = SAMPLE_RATES[version][rate_index]
+        samples_per_frame = 1152 if mpeg1 else 576
+        mono = head[i + 3] >> 6 == 3
+        # The VBR header follows the side information of the first frame
+        xing = i + 4 + ((17 if mono else 32) if mpeg1 else (9 if mono else 17))
+        if head[xing:xing + 4] in (b"Xing", b"Info") and len(head) >= xing + 12:
+            flags, = struct.unpack(">I", head[xing + 4:xing + 8])
+            if flags & 1:
+                frames, = struct.unpack(">I", head[xing + 8:xing + 12])
+                return frames * samples_per_frame / sample_rate
+        bitrate = BITRATES[1 if mpeg1 else 2][bitrate_index] * 1000
+        return (size - base - i) * 8 / bitrate
+    return None
+
+
+def wav_seconds(path: str) -> Optional[float]:
+    try:
+        with wave.open(path, "rb") as f:
+            return f.getnframes() / f.getframerate()
+    except (wave.Error, EOFError):
+        return None
+
+
+def audio_seconds(path: str) -> Optional[float]:
+    """
+    Duration of an .mp3 or .wav file read from its headers, or None if it cannot be read.
+    """
+    try:
+        if path.endswith(".wav"):
+            return wav_seconds(path)
+        return mp3_seconds(path)
+    except OSError:
+        return None
\ No newline at end of file
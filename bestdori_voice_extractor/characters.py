@@ -0,0 +1,21 @@
+from typing import Dict, List
+
+from bestdori_voice_extractor.config import BESTDORI_HOST
+from bestdori_voice_extractor.downloader.cache import listing_cache
+
+CHARACTERS_URL = f"{BESTDORI_HOST}/api/characters/all.5.json"
+
+
+def load_characters() -> Dict[str, Dict]:
+    """
+    Return the character metadata of Bestdori, keyed by character ID.
+    """
+    return {k: v for k, v in listing_cache.load(CHARACTERS_URL).data.items() if isinstance(v, dict)}
+
+
+def band_characters(band_id: int) -> List[str]:
+    """
+    Return the IDs of all characters of a band, in ascending order.
+    """
+    characters = load_characters()
+    return sorted((k for k, v in characters.items() if v.get("bandId") == band_id), key=int)
@@ -4,7 +4,73 @@ PROXY = {
   "http": "",
   "https": "",
 }
+# Upper bound of concurrent requests per endpoint class (listings, assets)
 MAX_WORKERS = 32
+# Attempts per request, including the first one
 MAX_RETRY = 3
-BESTDORI_INFO_URL = "https://bestdori.com/api/explorer/jp/assets/_info.json"
+# Concurrent requests per endpoint class before the scheduler has seen any response
+INITIAL_CONCURRENCY = 8
+# Seconds of the first retry delay, doubled for every further attempt and capped
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 30
+# Concurrency is halved when latency grows beyond this multiple of the best latency seen
+SLOW_FACTOR = 3
+# Failures in a row after which an endpoint class is paused for BREAKER_COOLDOWN seconds
+BREAKER_THRESHOLD = 5
+BREAKER_COOLDOWN = 30
+# Bytes read from the network per write when downloading a file
+CHUNK_SIZE = 1024 * 1024
+# Download engine: "thread" (one worker per directory) or "async" (one global queue)
+ENGINE = "thread"
+# SQLite manifest of downloaded files, used for incremental re-syncs
+MANIFEST_PATH = "manifest.db"
+# Directory for cached listings, shared by all downloaders
+CACHE_DIR = ".cache"
+# Seconds a cached listing is used before it is revalidated
+LISTING_TTL = 60 * 60
+# Index from voice ID to remote directory, used for selective downloads
+VOICE_INDEX_PATH = CACHE_DIR + "/voice_index_{locale}.db"
+# Content-addressed store that downloaded voices are hardlinked to, empty to disable
+POOL_DIR = f"{CACHE_DIR}/pool"
+# Analyzer mode: "thread" or "process" (parse files in batches on all cores)
+ANALYZER_MODE = "thread"
+# Scenario parser: "skim" (decode only talkData), "json" (decode the whole file) or "orjson" (if installed)
+ASSET_PARSER = "skim"
+# Per-file analysis results, so that re-runs only parse added or changed files
+ANALYSIS_CACHE_PATH = f"{CACHE_DIR}/analysis.db"
+# Indexed store of analyzed lines and voice files, read by the merger
+CATALOG_PATH = "catalog.db"
+# Merge output: "zip", "tar" or "dir" (a directory of hardlinks)
+MERGE_FORMAT = "zip"
+# ffmpeg executable used to convert merged voices to WAV
+FFMPEG = "ffmpeg"
+# Converted voices, keyed by the hash of their source and the conversion settings
+TRANSCODE_DIR = f"{CACHE_DIR}/wav"
+# Sample rate of converted voices, which are always mono 16-bit PCM
+TRANSCODE_SAMPLE_RATE = 32000
+# Leading and trailing audio quieter than this many dB is trimmed, None to keep it
+TRANSCODE_SILENCE = -50
+# Integrated loudness in LUFS that converted voices are normalized to, None to keep their loudness
+TRANSCODE_LOUDNESS = -16
+# Number of .list shards per split written by the dataset builder
+DATASET_SHARDS = 4
+# Fraction of voice files that go to the validation split
+DATASET_VALIDATION = 0.02
+# Live progress bar of running stages, shown on terminals only
+PROGRESS = True
+# Directory for one cProfile dump per stage, empty to disable profiling
+PROFILE_DIR = ""
+# Prefix of metric names in the Prometheus text format
+METRICS_PREFIX = "bve_"
+# Address of the HTTP API of the extraction service
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8765
+# Extraction jobs the service runs at the same time
+SERVICE_JOBS = 4
+# Directory the service writes the output of every job to, in a subdirectory named after the job
+SERVICE_OUTPUT_DIR = "jobs"
+# Seconds a finished job and its output are kept before the service removes them
+SERVICE_RETENTION = 24 * 60 * 60
+BESTDORI_HOST = "https://bestdori.com"
+# Default locale of downloaders, analyzers and mergers that are not given one
 CURRENT_LOCALE = Locale.JP
\ No newline at end of file
@@ -0,0 +1,195 @@
+import hashlib
+import heapq
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from bestdori_voice_extractor import console
+from bestdori_voice_extractor.audio import audio_seconds
+from bestdori_voice_extractor.config import CURRENT_LOCALE, DATASET_SHARDS, DATASET_VALIDATION, MAX_WORKERS
+from bestdori_voice_extractor.locale import Locale
+from bestdori_voice_extractor.metrics import metrics
+from bestdori_voice_extractor.store import CatalogStore
+from bestdori_voice_extractor.transcode import Transcoder
+
+SPLITS = ("train", "validation")
+
+
+class Sample(NamedTuple):
+    chara_id: int
+    text: str
+    voice_id: str
+    path: str
+    # Duration of the voice file, None if it was not measured
+    seconds: Optional[float]
+
+
+class DatasetBuilder:
+    """
+    Filters the analyzed lines of a locale into a training dataset and writes it as .list shards.
+
+    Lines without a local voice file or outside the text length bounds are filtered out by the store
+    in one query. Duplicate texts of a character, voice files that cannot be converted and voices
+    outside the duration bounds are dropped next, then every voice file is assigned to the train or
+    validation split by the hash of its ID, so the split stays the same as the catalog grows.
+    """
+    store: CatalogStore
+    locale: Locale
+    min_chars: int
+    max_chars: Optional[int]
+    min_seconds: Optional[float]
+    max_seconds: Optional[float]
+    dedup: bool
+    validation: float
+    shards: int
+    seed: str
+    transcoder: Optional[Transcoder]
+
+    def __init__(self, store: CatalogStore, locale: Locale = CURRENT_LOCALE, min_chars: int = 1,
+                 max_chars: Optional[int] = None, min_seconds: Optional[float] = None, max_seconds: Optional[float] = None,
+                 dedup: bool = True, validation: float = DATASET_VALIDATION, shards: int = DATASET_SHARDS,
+                 seed: str = "", transcoder: Optional[Transcoder] = None):
+        if shards < 1:
+            raise ValueError(f"Expected at least one shard, got {shards}")
+        if not 0 <= validation <= 1:
+            raise ValueError(f"Expected a validation fraction between 0 and 1, got {validation}")
+        self.store = store
+        self.locale = Locale(locale)
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self.min_seconds = min_seconds
+        self.max_seconds = max_seconds
+        self.dedup = dedup
+        self.validation = validation
+        self.shards = shards
+        self.seed = seed
+        self.transcoder = transcoder
+
+    @property
+    def stage(self) -> str:
+        return f"dataset {self.locale}"
+
+    def _drop(self, reason: str, count: int = 1):
+        if count:
+            metrics.inc("dataset_lines_total", count, stage=self.stage, result=reason)
+
+    def select(self, chara_ids: Optional[Iterable[str]] = None) -> List[Sample]:
+        """
+        Return the samples of the given characters, or of all characters, that pass every filter.
+        """
+        rows = self.store.voiced_lines(chara_ids, self.min_chars, self.max_chars, self.locale)
+        metrics.add_total(self.stage, len(rows))
+
+        if self.dedup:
+            seen = set()
+            unique = []
+            for row in rows:
+                key = (row[0], row[1].strip())
+                if key not in seen:
+                    seen.add(key)
+                    unique.append(row)
+            self._drop("duplicate", len(rows) - len(unique))
+            metrics.advance(self.stage, len(rows) - len(unique))
+            rows = unique
+
+        paths = {voice_id: path for _, _, voice_id, path in rows}
+        if self.transcoder is not None:
+            # Durations and the .list refer to the converted files
+            paths = self.transcoder.convert_all(paths)
+
+        seconds: Dict[str, Optional[float]] = {}
+        if self.min_seconds is not None or self.max_seconds is not None:
+            with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+                seconds = dict(zip(paths, executor.map(audio_seconds, paths.values())))
+
+        samples = []
+        for chara_id, text, voice_id, _ in rows:
+            metrics.advance(self.stage)
+            if voice_id not in paths:
+                self._drop("unconverted")
+                continue
+            if seconds:
+                duration = seconds[voice_id]
+                if duration is None:
+                    self._drop("unreadable")
+                    continue
+                if self.min_seconds is not None and duration < self.min_seconds:
+                    self._drop("too_short")
+                    continue
+                if self.max_seconds is not None and duration > self.max_seconds:
+                    self._drop("too_long")
+                    continue
+            samples.append(Sample(chara_id, text, voice_id, paths[voice_id], seconds.get(voice_id)))
+        self._drop("kept", len(samples))
+        return samples
+
+    def split_of(self, voice_id: str) -> str:
+        """
+        Split of a voice file, decided by the hash of its ID and the seed alone.
+        """
+        digest = hashlib.sha256(f"{self.seed}{voice_id}".encode("utf-8")).digest()
+        return "validation" if int.from_bytes(digest[:8], "big") < self.validation * 2 ** 64 else "train"
+
+    def shard(self, samples: List[Sample]) -> List[List[Sample]]:
+        """
+        Distribute samples over the shards so that every shard holds about the same duration of audio,
+        or the same number of lines if durations are unknown. Samples keep their order within a shard.
+        """
+        shards: List[List[Sample]] = [[] for _ in range(self.shards)]
+        loads = [(0.0, i) for i in range(self.shards)]
+        for sample in samples:
+            load, i = heapq.heappop(loads)
+            shards[i].append(sample)
+            heapq.heappush(loads, (load + (sample.seconds if sample.seconds is not None else 1), i))
+        return shards
+
+    def _write(self, file_path: str, samples: List[Sample]):
+        # Write next to the target and rename, so that loaders never read a partial shard
+        tmp_path = f"{file_path}.part"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.writelines(
+                f"{os.path.abspath(sample.path)}|{sample.chara_id}|{self.locale}|{sample.text}\n" for sample in samples
+            )
+        os.replace(tmp_path, file_path)
+
+    def build(self, output_dir: str, chara_ids: Optional[Iterable[str]] = None) -> Dict:
+        """
+        Write <split>-<i>-of-<n>.list shards of every split and a dataset.json describing them to output_dir,
+        and return that description.
+        """
+        with metrics.stage(self.stage):
+            return self._build(output_dir, chara_ids)
+
+    def _build(self, output_dir: str, chara_ids: Optional[Iterable[str]]) -> Dict:
+        samples = self.select(chara_ids)
+        splits: Dict[str, List[Sample]] = {split: [] for split in SPLITS}
+        for sample in samples:
+            splits[self.split_of(sample.voice_id)].append(sample)
+
+        os.makedirs(output_dir, exist_ok=True)
+        summary = {
+            "locale": str(self.locale),
+            "filters": {
+                "min_chars": self.min_chars, "max_chars": self.max_chars, "min_seconds": self.min_seconds,
+                "max_seconds": self.max_seconds, "dedup": self.dedup, "validation": self.validation, "seed": self.seed,
+                "wav": self.transcoder is not None,
+            },
+            "splits": {},
+        }
+        for split, split_samples in splits.items():
+            shards = []
+            for i, shard in enumerate(self.shard(split_samples)):
+                file_name = f"{split}-{i:05d}-of-{self.shards:05d}.list"
+                self._write(os.path.join(output_dir, file_name), shard)
+                durations = [sample.seconds for sample in shard if sample.seconds is not None]
+                shards.append({"path": file_name, "lines": len(shard), "seconds": sum(durations) if durations else None})
+            summary["splits"][split] = shards
+
+        with open(os.path.join(output_dir, "dataset.json"), "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=4)
+        console.print(
+            f"Dataset of [green]{len(samples)}[/] lines ({len(splits['train'])} train, {len(splits['validation'])} validation) "
+            f"written to {output_dir}"
+        )
+        return summary
\ No newline at end of file
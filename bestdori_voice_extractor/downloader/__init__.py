@@ -1,23 +1,52 @@
 import json
+from typing import Dict, Optional, Tuple
 
 import requests
 from requests.adapters import HTTPAdapter
-from requests.packages.urllib3.util.retry import Retry
 
-from bestdori_voice_extractor.config import BESTDORI_INFO_URL, MAX_WORKERS, PROXY
+from bestdori_voice_extractor.config import BESTDORI_HOST, CURRENT_LOCALE, MAX_WORKERS, PROXY
+from bestdori_voice_extractor.locale import Locale
 
 session = requests.Session()
-retries = Retry(total=5, backoff_factor=1, status_forcelist=[ 500, 502, 503, 504 ])
-adapter = HTTPAdapter(max_retries=retries, pool_connections=MAX_WORKERS, pool_maxsize=MAX_WORKERS)
+# Retries are left to the scheduler, so that every request has a single retry budget
+adapter = HTTPAdapter(pool_connections=MAX_WORKERS, pool_maxsize=MAX_WORKERS)
 session.mount('http://', adapter)
 session.mount('https://', adapter)
 session.proxies.update(PROXY)
 
 
+def info_url(locale: Locale) -> str:
+    return f"{BESTDORI_HOST}/api/explorer/{locale}/assets/_info.json"
+
+
+def listing_url(locale: Locale, prefix: Tuple[str, ...], directory: str) -> str:
+    return f"{BESTDORI_HOST}/api/explorer/{locale}/assets/{'/'.join(prefix)}/{directory}.json"
+
+
+def asset_url(locale: Locale, prefix: Tuple[str, ...], directory: str, asset: str) -> str:
+    return f"{BESTDORI_HOST}/assets/{locale}/{'/'.join(prefix)}/{directory}_rip/{asset}"
+
+
+def locale_path(path: str, locale: Locale) -> str:
+    """
+    Local directory of a locale: the path itself for the default locale, <path>_<locale> otherwise.
+    """
+    return path if Locale(locale) == CURRENT_LOCALE else f"{path}_{locale}"
+
+
+def conditional_headers(etag: Optional[str], last_modified: Optional[str]) -> Dict[str, str]:
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    return headers
+
+
 def load(url: str):
-    response = session.get(url, timeout=30)
+    from bestdori_voice_extractor.downloader.scheduler import scheduler
+
+    response = scheduler.call("listing", session.get, url, timeout=30)
     if response.status_code != 200:
         raise Exception(f"Failed to load {url}: {response.status_code}")
-    return json.loads(response.text)
-
-bestdori_info = load(BESTDORI_INFO_URL)
\ No newline at end of file
+    return json.loads(response.text)
\ No newline at end of file
@@ -1,7 +1,9 @@
 from typing import Dict, List, Tuple
 
-from bestdori_voice_extractor.downloader import bestdori_info
+from bestdori_voice_extractor.config import CURRENT_LOCALE
 from bestdori_voice_extractor.downloader.base import BaseTraverseDownloader
+from bestdori_voice_extractor.downloader.cache import get_bestdori_info
+from bestdori_voice_extractor.locale import Locale
 
 
 class AssetDownloader(BaseTraverseDownloader):
@@ -11,13 +13,12 @@ class AssetDownloader(BaseTraverseDownloader):
 
     def __init__(self, save_path: str = "assets", skip_list: List[Tuple[Tuple[str, ...], str]] = [
             (("scenario", ), "effects")
-        ]):
-        super().__init__(save_path, skip_list)
+        ], locale: Locale = CURRENT_LOCALE):
+        super().__init__(save_path, skip_list, locale=locale)
 
     @staticmethod
     def EXTENSION_TYPE() -> str:
         return ".asset"
 
-    @staticmethod
-    def ENTRYPOINT() -> Tuple[Dict, Tuple[str, ...], str]:
-        return bestdori_info, (), "scenario"
\ No newline at end of file
+    def ENTRYPOINT(self) -> Tuple[Dict, Tuple[str, ...], str]:
+        return get_bestdori_info(self.locale), (), "scenario"
\ No newline at end of file
@@ -1,15 +1,52 @@
+import asyncio
 import os
+import threading
 from abc import ABC, abstractmethod
+from collections import Counter
 from concurrent.futures import ThreadPoolExecutor
-from typing import Dict, List, Tuple
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import requests
 
 from bestdori_voice_extractor import console
 from bestdori_voice_extractor.config import (
+    CHUNK_SIZE,
     CURRENT_LOCALE,
-    MAX_RETRY,
+    ENGINE,
+    MANIFEST_PATH,
     MAX_WORKERS,
 )
-from bestdori_voice_extractor.downloader import load, session
+from bestdori_voice_extractor.downloader import asset_url, conditional_headers, listing_url, session
+from bestdori_voice_extractor.downloader.cache import ListingCache, listing_cache
+from bestdori_voice_extractor.downloader.manifest import Manifest, ManifestEntry
+from bestdori_voice_extractor.downloader.scheduler import scheduler
+from bestdori_voice_extractor.locale import Locale
+from bestdori_voice_extractor.metrics import metrics
+from bestdori_voice_extractor.pool import VoicePool
+
+ENGINES = ("thread", "async")
+PART_SUFFIX = ".part"
+
+# Downloads in progress in this process, keyed by target path, so that concurrent jobs
+# asking for the same file wait for one transfer instead of starting their own
+_inflight: Dict[str, threading.Event] = {}
+_inflight_lock = threading.Lock()
+
+
+@dataclass
+class Plan:
+    """
+    Files a downloader would fetch, gathered from all listings before downloading.
+    """
+    files: List[Tuple[Tuple[str, ...], str, str]]
+    # Sum of the sizes recorded in the manifest, with unknown files counted at the average size
+    estimated_bytes: int
+    unknown: int
+
+    @property
+    def count(self) -> int:
+        return len(self.files)
 
 
 class BaseTraverseDownloader(ABC):
@@ -19,80 +56,340 @@ class BaseTraverseDownloader(ABC):
 
     dir_executor: ThreadPoolExecutor
     save_path: str
+    # Name of the downloader in metrics and progress
+    stage: str
+    locale: Locale
     skip_list: List[Tuple[Tuple[str, ...], str]]
+    manifest: Manifest
+    listing_cache: ListingCache
+    pool: Optional[VoicePool]
+    stats: Counter
 
     @staticmethod
     @abstractmethod
     def EXTENSION_TYPE() -> str:
         raise NotImplementedError
-    
-    @staticmethod
+
     @abstractmethod
-    def ENTRYPOINT() -> Tuple[Dict, Tuple[str, ...], str]:
+    def ENTRYPOINT(self) -> Tuple[Dict, Tuple[str, ...], str]:
         raise NotImplementedError
 
-    def __init__(self, save_path: str, skip_list: List[Tuple[Tuple[str, ...], str]]):
+    def __init__(self, save_path: str, skip_list: List[Tuple[Tuple[str, ...], str]],
+                 manifest: Optional[Manifest] = None, cache: ListingCache = listing_cache,
+                 pool: Optional[VoicePool] = None, locale: Locale = CURRENT_LOCALE):
         self.dir_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
         self.save_path = save_path
+        self.stage = f"download {save_path}"
+        self.locale = Locale(locale)
         self.skip_list = skip_list
+        self.manifest = manifest or Manifest(MANIFEST_PATH)
+        self.listing_cache = cache
+        self.pool = pool
+        self.stats = Counter()
+        self._stats_lock = threading.Lock()
 
-    @staticmethod
-    def download(url: str, save_path: str):
-        response = session.get(url, stream=True, timeout=30)
+    def download(self, url: str, save_path: str, headers: Optional[Dict[str, str]] = None) -> Optional[requests.Response]:
+        """
+        Download url to save_path and return the response, or None if the server answered 304.
+        The scheduler reads the time to its headers from the response, not the time of the whole transfer.
+
+        Data is written to a .part file that is renamed on success. An existing .part file is
+        resumed with a Range request if the server still serves the same version of the file.
+        """
+        part_path = save_path + PART_SUFFIX
+        headers = dict(headers or {})
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        validator = self.manifest.get_partial(save_path) if offset else None
+        if validator:
+            headers.update({"Range": f"bytes={offset}-", "If-Range": validator, "Accept-Encoding": "identity"})
+
+        response = session.get(url, stream=True, timeout=30, headers=headers)
+        if response.status_code == 304:
+            response.close()
+            return None
+        if response.status_code == 416:
+            # The partial file no longer fits the remote one, start over on the next attempt
+            os.remove(part_path)
+            self.manifest.remove_partial(save_path)
         response.raise_for_status()
-        with open(save_path, "wb") as f:
-            for chunk in response.iter_content(chunk_size=8192):
+
+        # Content-Length is the encoded size when the body is compressed in transit
+        expected = None
+        if response.status_code == 206:
+            mode = "ab"
+            total = response.headers.get("Content-Range", "*").rsplit("/", 1)[-1]
+            expected = None if total == "*" else int(total)
+        else:
+            mode = "wb"
+            if "Content-Length" in response.headers and "Content-Encoding" not in response.headers:
+                expected = int(response.headers["Content-Length"])
+
+        validator = response.headers.get("ETag") or response.headers.get("Last-Modified")
+        if validator:
+            self.manifest.put_partial(save_path, validator)
+        with open(part_path, mode) as f:
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
                 f.write(chunk)
+                metrics.inc("bytes_total", len(chunk), stage=self.stage)
+
+        if expected is not None and os.path.getsize(part_path) != expected:
+            raise Exception(f"Incomplete download: {os.path.getsize(part_path)} of {expected} bytes")
+        os.replace(part_path, save_path)
+        self.manifest.remove_partial(save_path)
+        return response
+
+    def _count(self, key: str, n: int = 1):
+        with self._stats_lock:
+            self.stats[key] += n
+        metrics.inc("files_total", n, stage=self.stage, status=key)
+
+    def _submit(self, fn, *args):
+        """
+        Submit a job to the executor of the thread engine and track it as queued until it finishes.
+        """
+        def job():
+            try:
+                fn(*args)
+            finally:
+                metrics.add_gauge("queue_depth", -1, stage=self.stage)
+
+        metrics.add_gauge("queue_depth", 1, stage=self.stage)
+        self.dir_executor.submit(job)
+
+    def _path(self, prefix: Tuple[str, ...], directory: str, asset: str) -> str:
+        return f"{self.save_path}/{'/'.join(prefix)}/{directory}/{asset}"
+
+    def _asset_url(self, prefix: Tuple[str, ...], directory: str, asset: str) -> str:
+        return asset_url(self.locale, prefix, directory, asset)
+
+    def _listing_url(self, prefix: Tuple[str, ...], directory: str) -> str:
+        return listing_url(self.locale, prefix, directory)
+
+    @staticmethod
+    def _complete(download_path: str, entry: Optional[ManifestEntry]) -> bool:
+        """
+        Whether download_path exists with the size recorded in the manifest.
+        """
+        return entry is not None and os.path.exists(download_path) and os.path.getsize(download_path) == entry.size
+
+    def _pending(self, download_path: str, changed: Optional[float] = None) -> bool:
+        """
+        Whether a file must be downloaded or revalidated: it is not complete on disk, or the listing
+        that holds it changed after the file was last confirmed.
+        """
+        entry = self.manifest.get(download_path)
+        return not self._complete(download_path, entry) or (changed is not None and entry.seen < changed)
+
+    def _wanted(self, asset: str) -> bool:
+        """
+        Whether a file from a directory listing should be downloaded.
+        """
+        return asset.endswith(self.EXTENSION_TYPE())
+
+    def _adopt(self, url: str, download_path: str, listing: str) -> bool:
+        """
+        Record a file downloaded before the manifest existed if its size matches the remote one.
+        """
+        response = scheduler.call("asset", session.head, url, timeout=30)
+        expected = response.headers.get("Content-Length")
+        if response.status_code != 200 or expected is None or int(expected) != os.path.getsize(download_path):
+            return False
+        sha256 = self.pool.add(download_path) if self.pool else None
+        self.manifest.put(download_path, url, int(expected), response.headers.get("ETag"), response.headers.get("Last-Modified"), listing, sha256)
+        return True
 
     def _download(self, prefix: Tuple[str, ...], directory: str, asset: str):
-        download_path = f"{self.save_path}/{'/'.join(prefix)}/{directory}/{asset}"
-        if os.path.exists(download_path):
+        download_path = self._path(prefix, directory, asset)
+        with _inflight_lock:
+            event = _inflight.get(download_path)
+            if event is None:
+                _inflight[download_path] = threading.Event()
+        if event is not None:
+            event.wait()
+            self._count("shared")
+            metrics.advance(self.stage)
             return
-        
-        console.print(f"Downloading to [yellow]{download_path}[/] ...")
-        for _ in range(MAX_RETRY):
+
+        try:
+            self._transfer(prefix, directory, asset)
+        finally:
+            with _inflight_lock:
+                _inflight.pop(download_path).set()
+            metrics.advance(self.stage)
+
+    def _transfer(self, prefix: Tuple[str, ...], directory: str, asset: str):
+        download_path = self._path(prefix, directory, asset)
+        url = self._asset_url(prefix, directory, asset)
+        listing = self._listing_url(prefix, directory)
+        os.makedirs(os.path.dirname(download_path), exist_ok=True)
+        exists = os.path.exists(download_path)
+        entry = self.manifest.get(download_path)
+
+        if exists and entry is None:
             try:
-                self.download(f"https://bestdori.com/assets/{CURRENT_LOCALE}/{'/'.join(prefix)}/{directory}_rip/{asset}", download_path)
-                break
+                if self._adopt(url, download_path, listing):
+                    self._count("adopted")
+                    return
             except Exception as e:
-                console.print(f"[red]Failed to download {asset}[/]: {e}")
+                console.print(f"[red]Failed to check {asset}[/]: {e}")
+
+        headers = {}
+        if self._complete(download_path, entry):
+            status = "changed"
+            headers = conditional_headers(entry.etag, entry.last_modified)
+        else:
+            status = "repaired" if exists or os.path.exists(download_path + PART_SUFFIX) else "new"
 
-    def _process(self, prefix: Tuple[str, ...], directory: str, asset: str):
-        url = f"https://bestdori.com/api/explorer/{CURRENT_LOCALE}/assets/{'/'.join(prefix)}/{directory}.json"
         try:
-            asset_list: List[str] = load(url)
+            response = scheduler.call("asset", self.download, url, download_path, headers)
+        except Exception as e:
+            console.print(f"[red]Failed to download {asset}[/]: {e}")
+            self._count("failed")
+            return
+        if response is None:
+            self.manifest.touch(download_path)
+            self._count("unchanged")
+            return
+        sha256 = self.pool.add(download_path) if self.pool else None
+        self.manifest.put(
+            download_path, url, os.path.getsize(download_path),
+            response.headers.get("ETag"), response.headers.get("Last-Modified"), listing, sha256,
+        )
+        self._count(status)
+
+    def _list(self, prefix: Tuple[str, ...], directory: str) -> Optional[List[str]]:
+        """
+        Fetch the listing of a directory and return the files to download, or None on failure.
+        Files complete on disk and confirmed since the listing last changed are left out.
+        """
+        url = self._listing_url(prefix, directory)
+        try:
+            listing = self.listing_cache.load(url)
         except Exception as e:
             if "404" in str(e):
                 console.print(f"[yellow]Skipping missing directory {directory} (404)[/]")
-                return
+                return None
             console.print(f"[red]Failed to load list {url}[/]: {e}")
-            return
+            return None
 
         os.makedirs(f"{self.save_path}/{'/'.join(prefix)}/{directory}", exist_ok=True)
+        pending = []
+        wanted = [asset for asset in listing.data if self._wanted(asset)]
+        for asset in wanted:
+            if self._pending(self._path(prefix, directory, asset), listing.changed):
+                pending.append(asset)
+        self._count("unchanged", len(wanted) - len(pending))
+        metrics.inc("listings_total", stage=self.stage)
+        metrics.add_total(self.stage, len(pending))
+        return pending
+
+    def _process(self, prefix: Tuple[str, ...], directory: str, asset: str):
         # Process downloads sequentially in the current thread to avoid thread explosion.
         # Parallelism is already handled by the dir_executor calling this method.
-        for asset in asset_list:
-            if asset.endswith(self.EXTENSION_TYPE()):
-                self._download(prefix, directory, asset)
-    
-    def walk(self, parent: Dict, prefix: Tuple[str, ...], asset_name: str):
+        for asset in self._list(prefix, directory) or []:
+            self._download(prefix, directory, asset)
+
+    def traverse(self, parent: Dict, prefix: Tuple[str, ...], asset_name: str) -> Iterator[Tuple[Tuple[str, ...], str, str]]:
+        """
+        Yield every leaf directory below the entrypoint that is not in the skip list.
+        """
         if (prefix, asset_name) in self.skip_list:
             return
 
         if asset_name in parent:
             if isinstance(parent[asset_name], dict):
                 for k in parent[asset_name].keys():
-                    self.walk(parent[asset_name], (*prefix, asset_name), k)
+                    yield from self.traverse(parent[asset_name], (*prefix, asset_name), k)
             else:
-                self.dir_executor.submit(self._process, prefix, asset_name, parent[asset_name])
+                yield prefix, asset_name, parent[asset_name]
+
+    def walk(self, parent: Dict, prefix: Tuple[str, ...], asset_name: str):
+        for leaf in self.traverse(parent, prefix, asset_name):
+            self._submit(self._process, *leaf)
+
+    def plan(self) -> Plan:
+        """
+        Crawl all listings concurrently and return the files a run would download.
+        """
+        leaves = list(self.traverse(*self.ENTRYPOINT()))
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            listings = list(executor.map(lambda leaf: self._list(leaf[0], leaf[1]), leaves))
+
+        files = [(prefix, directory, asset) for (prefix, directory, _), assets in zip(leaves, listings) for asset in assets or []]
+        return self._plan(files)
+
+    def _plan(self, files: List[Tuple[Tuple[str, ...], str, str]]) -> Plan:
+        average = self.manifest.average_size(self.EXTENSION_TYPE()) or 0
+        estimated_bytes, unknown = 0, 0
+        for prefix, directory, asset in files:
+            entry = self.manifest.get(self._path(prefix, directory, asset))
+            if entry is None:
+                unknown += 1
+                estimated_bytes += int(average)
+            else:
+                estimated_bytes += entry.size
+        return Plan(files, estimated_bytes, unknown)
+
+    async def _run_async(self, plan: Optional[Plan] = None):
+        """
+        Run every listing fetch and file download through one global queue.
+
+        The number of workers bounds the concurrency, and the scheduler lowers it per endpoint class
+        while the server struggles. Blocking requests run on a bounded executor so that they share
+        the connection pool of the global session.
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+
+        if plan is None:
+            for prefix, directory, _ in self.traverse(*self.ENTRYPOINT()):
+                queue.put_nowait((self._list, prefix, directory))
+        else:
+            for prefix, directory, asset in plan.files:
+                queue.put_nowait((self._download, prefix, directory, asset))
+
+        async def worker():
+            while True:
+                job, prefix, directory, *args = await queue.get()
+                metrics.set_gauge("queue_depth", queue.qsize(), stage=self.stage)
+                try:
+                    result = await loop.run_in_executor(self.dir_executor, job, prefix, directory, *args)
+                    if job == self._list:
+                        for asset in result or []:
+                            queue.put_nowait((self._download, prefix, directory, asset))
+                        metrics.set_gauge("queue_depth", queue.qsize(), stage=self.stage)
+                except Exception as e:
+                    console.print(f"[red]Failed to process {directory}[/]: {e}")
+                finally:
+                    queue.task_done()
+
+        workers = [asyncio.ensure_future(worker()) for _ in range(MAX_WORKERS)]
+        await queue.join()
+        for w in workers:
+            w.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    def run(self, engine: str = ENGINE, plan: Optional[Plan] = None):
+        """
+        Download everything below the entrypoint, or only the files of a plan made beforehand.
+        """
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine {engine!r}, expected one of {ENGINES}")
 
-    def run(self):
         console.print("[yellow bold]Launching download...")
         if not os.path.exists(self.save_path):
             console.print(f"Creating [bold]{self.save_path}[/] directory...")
             os.mkdir(self.save_path)
-        
-        self.walk(*self.ENTRYPOINT())
-        console.print("[yellow]Shutting down executor...")
-        self.dir_executor.shutdown()
-        console.print("[green bold]Download complete!")
\ No newline at end of file
+
+        with metrics.stage(self.stage, plan.count if plan is not None else None):
+            if engine == "async":
+                asyncio.run(self._run_async(plan))
+            elif plan is None:
+                self.walk(*self.ENTRYPOINT())
+            else:
+                for leaf in plan.files:
+                    self._submit(self._download, *leaf)
+            console.print("[yellow]Shutting down executor...")
+            self.dir_executor.shutdown()
+        console.print("[green bold]Download complete!")
+        console.print(", ".join(f"{key}: {self.stats[key]}" for key in ("new", "changed", "repaired", "adopted", "unchanged", "shared", "failed")))
@@ -0,0 +1,108 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+from bestdori_voice_extractor import console
+from bestdori_voice_extractor.config import CACHE_DIR, CURRENT_LOCALE, LISTING_TTL
+from bestdori_voice_extractor.downloader import conditional_headers, info_url, session
+from bestdori_voice_extractor.downloader.scheduler import scheduler
+from bestdori_voice_extractor.locale import Locale
+
+
+class Listing(NamedTuple):
+    data: Any
+    # Time the listing body was last seen to change
+    changed: float
+
+
+class ListingCache:
+    """
+    On-disk cache of Bestdori explorer listings with a TTL and conditional revalidation.
+    """
+    cache_dir: str
+    ttl: float
+
+    def __init__(self, cache_dir: str = os.path.join(CACHE_DIR, "listings"), ttl: float = LISTING_TTL):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+
+    def _path(self, url: str) -> str:
+        return os.path.join(self.cache_dir, f"{hashlib.sha1(url.encode()).hexdigest()}.json")
+
+    def _read(self, url: str) -> Optional[dict]:
+        try:
+            with open(self._path(url), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, url: str, entry: dict):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(url)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def load(self, url: str, refresh: bool = False) -> Listing:
+        """
+        Return the listing at url, from disk while it is younger than the TTL and revalidated otherwise,
+        or always revalidated with refresh. A stale copy is returned if the server cannot be reached.
+        """
+        entry = self._read(url)
+        now = time.time()
+        if entry and not refresh and now - entry["fetched"] < self.ttl:
+            return Listing(json.loads(entry["body"]), entry["changed"])
+
+        headers = conditional_headers(entry["etag"], entry["last_modified"]) if entry else {}
+        try:
+            response = scheduler.call("listing", session.get, url, timeout=30, headers=headers)
+            if response.status_code >= 500:
+                raise Exception(f"Failed to load {url}: {response.status_code}")
+        except Exception as e:
+            if entry is None:
+                raise
+            console.print(f"[yellow]Using cached copy of {url}[/]: {e}")
+            return Listing(json.loads(entry["body"]), entry["changed"])
+
+        if response.status_code == 304 and entry:
+            entry["fetched"] = now
+            self._write(url, entry)
+            return Listing(json.loads(entry["body"]), entry["changed"])
+        if response.status_code != 200:
+            raise Exception(f"Failed to load {url}: {response.status_code}")
+
+        changed = entry["changed"] if entry and entry["body"] == response.text else now
+        self._write(url, {
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "body": response.text,
+            "fetched": now,
+            "changed": changed,
+        })
+        return Listing(json.loads(response.text), changed)
+
+
+listing_cache = ListingCache()
+
+# Locale -> (time loaded, asset tree)
+_bestdori_info: Dict[Locale, Tuple[float, Dict]] = {}
+_bestdori_info_lock = threading.Lock()
+
+
+def get_bestdori_info(locale: Locale = CURRENT_LOCALE, refresh: bool = False) -> Dict:
+    """
+    Return the Bestdori asset tree (_info.json) of a locale, loaded through the listing cache.
+    It is kept in memory for the TTL of the listing cache, and revalidated right away with refresh.
+    """
+    locale = Locale(locale)
+    with _bestdori_info_lock:
+        loaded = _bestdori_info.get(locale)
+        if refresh or loaded is None or time.time() - loaded[0] >= listing_cache.ttl:
+            loaded = time.time(), listing_cache.load(info_url(locale), refresh=refresh).data
+            _bestdori_info[locale] = loaded
+        return loaded[1]
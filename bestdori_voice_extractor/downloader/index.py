@@ -0,0 +1,127 @@
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Tuple
+
+from bestdori_voice_extractor import console
+from bestdori_voice_extractor.config import LISTING_TTL, MAX_WORKERS
+from bestdori_voice_extractor.downloader.base import BaseTraverseDownloader
+
+# (prefix, directory, file name)
+Location = Tuple[Tuple[str, ...], str, str]
+
+
+class VoiceIndex:
+    """
+    Persistent index from voice ID to the remote directory that holds it.
+
+    Voice IDs the index does not know are only looked for again once its last refresh is older
+    than LISTING_TTL, since the listings it was built from are cached that long anyway.
+    """
+    db_path: str
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS voices ("
+                "voice_id TEXT PRIMARY KEY, prefix TEXT NOT NULL, directory TEXT NOT NULL, asset TEXT NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS voices_directory ON voices (prefix, directory)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS listings (url TEXT PRIMARY KEY, changed REAL NOT NULL)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value REAL NOT NULL)")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM voices").fetchone()[0]
+
+    @staticmethod
+    def _location(prefix: str, directory: str, asset: str) -> Location:
+        return tuple(prefix.split("/")) if prefix else (), directory, asset
+
+    def lookup(self, voice_ids: Iterable[str]) -> Dict[str, Location]:
+        voice_ids = list(voice_ids)
+        found = {}
+        with self._lock:
+            # Stay below SQLite's limit on the number of bound parameters
+            for i in range(0, len(voice_ids), 500):
+                chunk = voice_ids[i:i + 500]
+                for voice_id, prefix, directory, asset in self._conn.execute(
+                    f"SELECT * FROM voices WHERE voice_id IN ({', '.join('?' * len(chunk))})", chunk
+                ):
+                    found[voice_id] = self._location(prefix, directory, asset)
+        return found
+
+    def all(self) -> Dict[str, Location]:
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM voices").fetchall()
+        return {voice_id: self._location(prefix, directory, asset) for voice_id, prefix, directory, asset in rows}
+
+    @property
+    def refreshed(self) -> float:
+        """
+        Time of the last refresh, 0 if the index was never refreshed.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM state WHERE key = 'refreshed'").fetchone()
+        return row[0] if row else 0.0
+
+    def resolve(self, downloader: BaseTraverseDownloader, voice_ids: Iterable[str]) -> Dict[str, Location]:
+        """
+        Look up voice IDs, refreshing the index first when some are unknown and it is older than LISTING_TTL.
+        """
+        wanted = set(voice_ids)
+        locations = self.lookup(wanted)
+        unknown = len(wanted) - len(locations)
+        if unknown and time.time() - self.refreshed >= LISTING_TTL:
+            console.print(f"Refreshing voice index for [yellow]{unknown}[/] unknown voices...")
+            self.refresh(downloader)
+            locations = self.lookup(wanted)
+        return locations
+
+    def refresh(self, downloader: BaseTraverseDownloader) -> int:
+        """
+        Re-read the listings of the downloader through its listing cache and re-index the
+        directories whose listing changed since they were indexed. Returns the number of such directories.
+        """
+        leaves = [(prefix, directory) for prefix, directory, _ in downloader.traverse(*downloader.ENTRYPOINT())]
+        with self._lock:
+            indexed = dict(self._conn.execute("SELECT url, changed FROM listings").fetchall())
+
+        def load(leaf):
+            url = downloader._listing_url(*leaf)
+            try:
+                return url, downloader.listing_cache.load(url)
+            except Exception as e:
+                console.print(f"[red]Failed to load list {url}[/]: {e}")
+                return url, None
+
+        updated = 0
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            for (prefix, directory), (url, listing) in zip(leaves, executor.map(load, leaves)):
+                if listing is None or indexed.get(url, -1) >= listing.changed:
+                    continue
+                rows = [
+                    (os.path.splitext(asset)[0], "/".join(prefix), directory, asset)
+                    for asset in listing.data if downloader._wanted(asset)
+                ]
+                with self._lock, self._conn:
+                    self._conn.execute("DELETE FROM voices WHERE prefix = ? AND directory = ?", ("/".join(prefix), directory))
+                    self._conn.executemany("INSERT OR REPLACE INTO voices VALUES (?, ?, ?, ?)", rows)
+                    self._conn.execute("INSERT OR REPLACE INTO listings VALUES (?, ?)", (url, listing.changed))
+                updated += 1
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO state VALUES ('refreshed', ?)", (time.time(),))
+        return updated
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
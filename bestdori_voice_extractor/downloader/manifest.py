@@ -0,0 +1,91 @@
+import sqlite3
+import threading
+import time
+from typing import NamedTuple, Optional
+
+
+class ManifestEntry(NamedTuple):
+    path: str
+    url: str
+    size: int
+    etag: Optional[str]
+    last_modified: Optional[str]
+    listing: str
+    seen: float
+    sha256: Optional[str]
+
+
+class Manifest:
+    """
+    SQLite record of downloaded files and the directory listings they were seen in.
+    """
+    db_path: str
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "path TEXT PRIMARY KEY, url TEXT NOT NULL, size INTEGER NOT NULL, "
+                "etag TEXT, last_modified TEXT, listing TEXT NOT NULL, seen REAL NOT NULL, sha256 TEXT)"
+            )
+            # Manifests written before checksums were recorded
+            if "sha256" not in [row[1] for row in self._conn.execute("PRAGMA table_info(files)")]:
+                self._conn.execute("ALTER TABLE files ADD COLUMN sha256 TEXT")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS partials (path TEXT PRIMARY KEY, validator TEXT NOT NULL)")
+
+    def get(self, path: str) -> Optional[ManifestEntry]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM files WHERE path = ?", (path,)).fetchone()
+        return ManifestEntry(*row) if row else None
+
+    def put(self, path: str, url: str, size: int, etag: Optional[str], last_modified: Optional[str], listing: str,
+            sha256: Optional[str] = None):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (path, url, size, etag, last_modified, listing, time.time(), sha256),
+            )
+
+    def remove(self, path: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM files WHERE path = ?", (path,))
+
+    def touch(self, path: str):
+        """
+        Mark a file as confirmed unchanged by the server.
+        """
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE files SET seen = ? WHERE path = ?", (time.time(), path))
+
+    def average_size(self, suffix: str) -> Optional[float]:
+        """
+        Return the average recorded size of files ending with suffix, or None if there are none.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT AVG(size) FROM files WHERE path LIKE ?", (f"%{suffix}",)).fetchone()
+        return row[0]
+
+    def get_partial(self, path: str) -> Optional[str]:
+        """
+        Return the ETag or Last-Modified value of the response a partial download was started from.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT validator FROM partials WHERE path = ?", (path,)).fetchone()
+        return row[0] if row else None
+
+    def put_partial(self, path: str, validator: str):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO partials VALUES (?, ?)", (path, validator))
+
+    def remove_partial(self, path: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM partials WHERE path = ?", (path,))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
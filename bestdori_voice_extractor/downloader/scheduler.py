@@ -0,0 +1,210 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Optional, TypeVar
+
+import requests
+
+from bestdori_voice_extractor.config import (
+    BACKOFF_BASE,
+    BACKOFF_CAP,
+    BREAKER_COOLDOWN,
+    BREAKER_THRESHOLD,
+    INITIAL_CONCURRENCY,
+    MAX_RETRY,
+    MAX_WORKERS,
+    SLOW_FACTOR,
+)
+from bestdori_voice_extractor.metrics import metrics
+
+T = TypeVar("T")
+
+# Statuses that mean the server is overloaded or failing rather than that the request is wrong
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def retry_after(response: Optional[requests.Response]) -> Optional[float]:
+    """
+    Seconds to wait according to the Retry-After header, which holds either seconds or an HTTP date.
+    """
+    value = response.headers.get("Retry-After") if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class Endpoint:
+    """
+    Concurrency limit and circuit breaker of one class of requests.
+
+    The limit grows by one per window of successful requests and is halved when the server
+    throttles, fails, or gets much slower than the fastest latency seen so far (AIMD).
+    After BREAKER_THRESHOLD failures in a row no request is sent for BREAKER_COOLDOWN seconds,
+    then a single probe decides whether the breaker closes again.
+    """
+    kind: str
+    limit: float
+    active: int
+
+    def __init__(self, kind: str, limit: float = INITIAL_CONCURRENCY, ceiling: int = MAX_WORKERS):
+        self.kind = kind
+        self.limit = float(min(limit, ceiling))
+        self.ceiling = ceiling
+        self.active = 0
+        self._cond = threading.Condition()
+        # Exponentially weighted average and best average of request latency
+        self._latency: Optional[float] = None
+        self._baseline: Optional[float] = None
+        self._last_decrease = 0.0
+        self._failures = 0
+        self._open_until = 0.0
+        self._probing = False
+        # Requests are held back until then after a Retry-After
+        self._paused_until = 0.0
+
+    def acquire(self):
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                wait = max(self._paused_until, self._open_until) - now
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                if self._failures >= BREAKER_THRESHOLD:
+                    # Half-open: let one probe through and hold everything else back until it returns
+                    if self._probing:
+                        self._cond.wait()
+                        continue
+                    self._probing = True
+                    break
+                if self.active < int(self.limit):
+                    break
+                self._cond.wait()
+            self.active += 1
+
+    def _decrease(self, now: float):
+        # Requests in flight when the server struggled all report it, only react once per latency window
+        if now - self._last_decrease > (self._latency or 0):
+            self.limit = max(1.0, self.limit / 2)
+            self._last_decrease = now
+
+    def release(self, latency: Optional[float] = None, failed: bool = False, pause: Optional[float] = None):
+        """
+        Record the outcome of a request. Without a latency the request neither helps nor hurts.
+        """
+        with self._cond:
+            now = time.monotonic()
+            self.active -= 1
+            self._probing = False
+            if pause:
+                self._paused_until = max(self._paused_until, now + pause)
+            if failed:
+                self._failures += 1
+                self._decrease(now)
+                if self._failures >= BREAKER_THRESHOLD:
+                    self._open_until = now + BREAKER_COOLDOWN
+                    metrics.inc("breaker_opened_total", kind=self.kind)
+            elif latency is not None:
+                self._failures = 0
+                self._latency = latency if self._latency is None else 0.8 * self._latency + 0.2 * latency
+                self._baseline = self._latency if self._baseline is None else min(self._baseline, self._latency)
+                if self._latency > SLOW_FACTOR * self._baseline:
+                    self._decrease(now)
+                else:
+                    self.limit = min(self.ceiling, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+        metrics.set_gauge("concurrency_limit", int(self.limit), kind=self.kind)
+
+
+class Scheduler:
+    """
+    Sends every Bestdori request through a per-endpoint concurrency limit, with one retry budget of
+    MAX_RETRY attempts, jittered exponential backoff and Retry-After support.
+    """
+    endpoints: Dict[str, Endpoint]
+
+    def __init__(self):
+        self.endpoints = {}
+        self._lock = threading.Lock()
+
+    def endpoint(self, kind: str) -> Endpoint:
+        with self._lock:
+            if kind not in self.endpoints:
+                self.endpoints[kind] = Endpoint(kind)
+            return self.endpoints[kind]
+
+    @staticmethod
+    def latency(result, start: float) -> float:
+        """
+        Seconds until the response headers arrived, so that streaming a large body does not read as a slow server.
+        Results that are not responses, such as a 304 the downloader turned into None, count from the start.
+        """
+        if isinstance(result, requests.Response):
+            return result.elapsed.total_seconds()
+        return time.monotonic() - start
+
+    @staticmethod
+    def backoff(attempt: int) -> float:
+        """
+        Full jitter: a random delay up to an exponentially growing cap.
+        """
+        return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+    def call(self, kind: str, fn: Callable[..., T], *args, **kwargs) -> T:
+        """
+        Run a request function under the limit of the endpoint class kind and retry it on failure.
+
+        A returned response with a retryable status counts as a failure. HTTP errors raised for other
+        statuses are passed on at once, except 416, which the downloader recovers from by starting over.
+        """
+        endpoint = self.endpoint(kind)
+        for attempt in range(MAX_RETRY):
+            endpoint.acquire()
+            start = time.monotonic()
+            metrics.inc("http_requests_total", kind=kind)
+            try:
+                result = fn(*args, **kwargs)
+                if isinstance(result, requests.Response) and result.status_code in RETRY_STATUSES:
+                    raise requests.HTTPError(f"{result.status_code} for {result.url}", response=result)
+            except requests.HTTPError as e:
+                status = e.response.status_code if e.response is not None else None
+                if status in RETRY_STATUSES:
+                    e.response.close()
+                    pause = retry_after(e.response)
+                    metrics.inc("http_errors_total", kind=kind, reason="throttled" if status == 429 else "server")
+                    endpoint.release(failed=True, pause=pause)
+                    delay = max(pause or 0, self.backoff(attempt))
+                elif status == 416:
+                    endpoint.release()
+                    delay = 0
+                else:
+                    endpoint.release(self.latency(e.response, start))
+                    raise
+                error = e
+            except (requests.ConnectionError, requests.Timeout) as e:
+                metrics.inc("http_errors_total", kind=kind, reason="connection")
+                endpoint.release(failed=True)
+                delay, error = self.backoff(attempt), e
+            except Exception as e:
+                # Broken transfers say nothing about the load of the server
+                endpoint.release()
+                delay, error = self.backoff(attempt), e
+            else:
+                endpoint.release(self.latency(result, start))
+                return result
+
+            if attempt + 1 < MAX_RETRY:
+                metrics.inc("http_retries_total", kind=kind)
+                time.sleep(delay)
+        raise error
+
+
+scheduler = Scheduler()
\ No newline at end of file
@@ -0,0 +1,161 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from bestdori_voice_extractor import console
+from bestdori_voice_extractor.audio import mp3_seconds
+from bestdori_voice_extractor.config import ENGINE, MAX_WORKERS
+from bestdori_voice_extractor.downloader.base import PART_SUFFIX, BaseTraverseDownloader, Plan
+from bestdori_voice_extractor.metrics import metrics
+from bestdori_voice_extractor.pool import file_sha256
+
+# (prefix, directory, file name)
+Location = Tuple[Tuple[str, ...], str, str]
+
+# ok: size and checksum match the manifest and the file decodes
+# missing: listed remotely but not on disk
+# partial: only an unfinished .part download, or a size that differs from the recorded one
+# unrecorded: on disk without a manifest entry, so its size is confirmed with the server on repair
+# corrupt: the SHA-256 differs from the recorded one
+# undecodable: the file is not valid JSON or MP3
+STATUSES = ("ok", "missing", "partial", "unrecorded", "corrupt", "undecodable")
+
+
+def _decodes_json(path: str) -> bool:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            json.load(f)
+        return True
+    except ValueError:
+        return False
+
+
+def _decodes_mp3(path: str) -> bool:
+    return mp3_seconds(path) is not None
+
+
+# Extension -> check that a file can be decoded
+DECODERS: Dict[str, Callable[[str], bool]] = {
+    ".asset": _decodes_json,
+    ".mp3": _decodes_mp3,
+}
+
+
+class Verifier:
+    """
+    Checks a local mirror against the remote listings and the manifest of its downloader.
+
+    Every file named by a listing is size-checked against the manifest, hashed against the recorded
+    SHA-256 and decoded, in parallel. repair() then downloads again only the files that failed.
+    """
+    downloader: BaseTraverseDownloader
+    # Whether files are hashed and decoded, or only size-checked
+    deep: bool
+    stage: str
+
+    def __init__(self, downloader: BaseTraverseDownloader, deep: bool = True):
+        self.downloader = downloader
+        self.deep = deep
+        self.stage = f"verify {downloader.save_path}"
+
+    def expected(self) -> List[Location]:
+        """
+        Every file below the entrypoint of the downloader according to the remote listings.
+        """
+        downloader = self.downloader
+        leaves = [(prefix, directory) for prefix, directory, _ in downloader.traverse(*downloader.ENTRYPOINT())]
+
+        def load(leaf):
+            url = downloader._listing_url(*leaf)
+            try:
+                return downloader.listing_cache.load(url).data
+            except Exception as e:
+                console.print(f"[red]Failed to load list {url}[/]: {e}")
+                return []
+
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            listings = list(executor.map(load, leaves))
+        return [
+            (prefix, directory, asset)
+            for (prefix, directory), assets in zip(leaves, listings) for asset in assets if downloader._wanted(asset)
+        ]
+
+    def check(self, location: Location) -> str:
+        """
+        Return the status of one file.
+        """
+        path = self.downloader._path(*location)
+        if not os.path.exists(path):
+            return "partial" if os.path.exists(path + PART_SUFFIX) else "missing"
+        entry = self.downloader.manifest.get(path)
+        if entry is None:
+            return "unrecorded"
+        if os.path.getsize(path) != entry.size:
+            return "partial"
+        if self.deep:
+            if entry.sha256 is not None and file_sha256(path) != entry.sha256:
+                return "corrupt"
+            decodes = DECODERS.get(self.downloader.EXTENSION_TYPE())
+            if decodes is not None and not decodes(path):
+                return "undecodable"
+        return "ok"
+
+    def run(self) -> Dict[str, List[Location]]:
+        """
+        Check every listed file and return the files of every status.
+        """
+        with metrics.stage(self.stage):
+            locations = self.expected()
+            metrics.add_total(self.stage, len(locations))
+
+            def check(location: Location) -> str:
+                try:
+                    status = self.check(location)
+                except OSError as e:
+                    console.print(f"[red]Cannot read {self.downloader._path(*location)}[/]: {e}")
+                    status = "undecodable"
+                metrics.inc("verified_files_total", stage=self.stage, status=status)
+                metrics.advance(self.stage)
+                return status
+
+            report: Dict[str, List[Location]] = {status: [] for status in STATUSES}
+            with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+                for location, status in zip(locations, executor.map(check, locations)):
+                    report[status].append(location)
+
+        console.print(", ".join(f"{status}: {len(report[status])}" for status in STATUSES))
+        return report
+
+    def plan(self, report: Dict[str, List[Location]]) -> Plan:
+        """
+        Plan the download of every file that failed verification.
+
+        Corrupt and undecodable files have the right size, so the downloader would only revalidate them.
+        They are removed together with their manifest entries first, so that they are fetched in full.
+        """
+        pool = self.downloader.pool
+        files = [location for status in STATUSES if status != "ok" for location in report[status]]
+        for location in files:
+            entry = self.downloader.manifest.get(self.downloader._path(*location))
+            # A file damaged in place also damages the pool blob it is hardlinked to
+            if pool is not None and entry is not None and entry.sha256:
+                pool.evict(entry.sha256)
+        for location in report["corrupt"] + report["undecodable"]:
+            path = self.downloader._path(*location)
+            self.downloader.manifest.remove(path)
+            if os.path.exists(path):
+                os.remove(path)
+        return self.downloader._plan(files)
+
+    def repair(self, report: Optional[Dict[str, List[Location]]] = None, engine: str = ENGINE):
+        """
+        Download again every file that failed verification, verifying first if no report is given.
+        """
+        report = report if report is not None else self.run()
+        plan = self.plan(report)
+        if not plan.count:
+            console.print("[green]Nothing to repair.")
+            return
+        console.print(f"Downloading [yellow]{plan.count}[/] files again...")
+        self.downloader.run(engine=engine, plan=plan)
\ No newline at end of file
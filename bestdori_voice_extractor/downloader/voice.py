@@ -1,7 +1,11 @@
-from typing import Dict, List, Tuple
+from typing import Dict, Iterable, List, Optional, Tuple
 
-from bestdori_voice_extractor.downloader import bestdori_info
-from bestdori_voice_extractor.downloader.base import BaseTraverseDownloader
+from bestdori_voice_extractor.config import CURRENT_LOCALE, POOL_DIR, VOICE_INDEX_PATH
+from bestdori_voice_extractor.downloader.base import BaseTraverseDownloader, Plan
+from bestdori_voice_extractor.downloader.cache import get_bestdori_info
+from bestdori_voice_extractor.downloader.index import VoiceIndex
+from bestdori_voice_extractor.locale import Locale
+from bestdori_voice_extractor.pool import VoicePool
 
 
 class VoiceDownloader(BaseTraverseDownloader):
@@ -9,13 +13,29 @@ class VoiceDownloader(BaseTraverseDownloader):
     Voice downloader.
     """
 
-    def __init__(self, save_path: str = "voices", skip_list: List[Tuple[Tuple[str, ...], str]] = []):
-        super().__init__(save_path, skip_list)
+    def __init__(self, save_path: str = "voices", skip_list: List[Tuple[Tuple[str, ...], str]] = [],
+                 pool: Optional[VoicePool] = None, locale: Locale = CURRENT_LOCALE):
+        super().__init__(save_path, skip_list, pool=pool or (VoicePool(POOL_DIR) if POOL_DIR else None), locale=locale)
 
     @staticmethod
     def EXTENSION_TYPE() -> str:
         return ".mp3"
 
-    @staticmethod
-    def ENTRYPOINT() -> Tuple[Dict, Tuple[str, ...], str]:
-        return bestdori_info["sound"], ("sound",), "voice"
\ No newline at end of file
+    def ENTRYPOINT(self) -> Tuple[Dict, Tuple[str, ...], str]:
+        return get_bestdori_info(self.locale)["sound"], ("sound",), "voice"
+
+    def plan_voices(self, voice_ids: Iterable[str], index: Optional[VoiceIndex] = None) -> Plan:
+        """
+        Plan the download of specific voice files from the voice index, without crawling the listings.
+        The index is only refreshed when it does not know some of the voice IDs and is older than LISTING_TTL.
+        """
+        index = index or VoiceIndex(VOICE_INDEX_PATH.format(locale=self.locale))
+        locations = index.resolve(self, voice_ids)
+
+        files = []
+        for location in locations.values():
+            download_path = self._path(*location)
+            if not self._complete(download_path, self.manifest.get(download_path)):
+                files.append(location)
+        self._count("unchanged", len(locations) - len(files))
+        return self._plan(files)
\ No newline at end of file
@@ -1,49 +1,180 @@
+import io
 import json
 import os
-import shutil
-from typing import Dict, List
-from zipfile import ZipFile
+import tarfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from zipfile import ZIP_STORED, ZipFile
 
 from bestdori_voice_extractor import console
-from bestdori_voice_extractor.config import CURRENT_LOCALE
+from bestdori_voice_extractor.config import CURRENT_LOCALE, MAX_WORKERS, MERGE_FORMAT
+from bestdori_voice_extractor.locale import Locale
+from bestdori_voice_extractor.metrics import metrics
+from bestdori_voice_extractor.pool import clone
+from bestdori_voice_extractor.store import CatalogStore
+from bestdori_voice_extractor.transcode import Transcoder
+
+FORMATS = ("zip", "tar", "dir")
 
 
 class AssetMerger:
     chara_id: str
+    locale: Locale
     lines: List[Dict[str, str]]
     voices: Dict[str, str]
+    transcoder: Optional[Transcoder]
 
-    def __init__(self, chara_id: str, asset_json_path: str, voice_json_path: str):
+    def __init__(self, chara_id: str, asset_json_path: Optional[str] = None, voice_json_path: Optional[str] = None,
+                 store: Optional[CatalogStore] = None, locale: Locale = CURRENT_LOCALE,
+                 transcoder: Optional[Transcoder] = None):
+        """
+        Load the lines of a character either from the indexed store or from asset.json and voice.json.
+        With a transcoder, the voice files are converted to WAV before they are merged.
+        """
         self.chara_id = str(chara_id)
+        self.locale = Locale(locale)
+        self.transcoder = transcoder
+
+        if store is not None:
+            self.lines = store.lines(int(chara_id), self.locale)
+            self.voices = store.voices((line["voice_file"] for line in self.lines), self.locale)
+            return
 
         with open(asset_json_path, "r", encoding="utf-8") as f:
-            self.lines = json.load(f)[chara_id]
+            self.lines = json.load(f)[self.chara_id]
         
         with open(voice_json_path, "r", encoding="utf-8") as f:
             self.voices = json.load(f)
     
-    def merge(self):
-        os.makedirs(f"output/{self.chara_id}", exist_ok=True)
-        os.chdir(f"output/{self.chara_id}")
-        with open(f"{self.chara_id}.list", mode="w", encoding="utf-8") as f:
-            for line in self.lines:
-                if line['voice_file'] in self.voices:
-                    shutil.copyfile(f"../../{self.voices[line['voice_file']]}", f"{line['voice_file']}.mp3")
-                    f.write(f"{line['voice_file']}.mp3|{self.chara_id}|{CURRENT_LOCALE}|{line['text']}\n")
-                    console.print(f"{line['voice_file']}.mp3|{self.chara_id}|{CURRENT_LOCALE}|{line['text']}")
-                else:
-                    console.print(f"Voice file [yellow]{line['voice_file']}[/] not found. Skipping...")
-        
-        # Zip output/chara_id folder
-        with ZipFile(f"../../{self.chara_id}.zip", "w") as zipf:
-            for root, dirs, files in os.walk("."):
-                for file in files:
-                    zipf.write(os.path.join(root, file), os.path.relpath(os.path.join(root, file), "."))
-        
-        # Clean up
-        os.chdir("../")
-        shutil.rmtree(self.chara_id)
-        os.chdir("../")
+    @classmethod
+    def from_data(cls, chara_id: str, lines: List[Dict[str, str]], voices: Dict[str, str],
+                  locale: Locale = CURRENT_LOCALE, transcoder: Optional[Transcoder] = None) -> "AssetMerger":
+        """
+        Build a merger from analysis data that is already in memory.
+        """
+        merger = cls.__new__(cls)
+        merger.chara_id = str(chara_id)
+        merger.locale = Locale(locale)
+        merger.lines = lines
+        merger.voices = voices
+        merger.transcoder = transcoder
+        return merger
+
+    def entries(self) -> Iterator[Tuple[str, str, str]]:
+        """
+        Yield (archive name, source path, .list row) for every line with a local voice file.
+        """
+        stage = self.stage
+        sources, extension = self.voices, "mp3"
+        if self.transcoder is not None:
+            # Convert all voice files of the character up front, so that every core has work
+            wanted = {line['voice_file'] for line in self.lines}
+            sources = self.transcoder.convert_all(
+                {voice_id: path for voice_id, path in self.voices.items() if voice_id in wanted}, stage
+            )
+            extension = "wav"
+
+        missing = 0
+        for line in self.lines:
+            metrics.advance(stage)
+            if line['voice_file'] in sources:
+                name = f"{line['voice_file']}.{extension}"
+                row = f"{name}|{self.chara_id}|{self.locale}|{line['text']}"
+                metrics.inc("merged_lines_total", stage=stage)
+                yield name, sources[line['voice_file']], row
+            else:
+                missing += 1
+        if missing:
+            metrics.inc("missing_voices_total", missing, stage=stage)
+            console.print(f"[yellow]{missing}[/] voice files of character {self.chara_id} not found. Skipping...")
+
+    @property
+    def stage(self) -> str:
+        return f"merge {self.chara_id} {self.locale}"
+
+    def merge(self, output_dir: str = ".", format: str = MERGE_FORMAT, compression: int = ZIP_STORED) -> str:
+        """
+        Write the voice files and the .list of the character straight from their source paths into
+        <chara_id>.zip, <chara_id>.tar or a <chara_id> directory of hardlinks, and return its path.
+        """
+        with metrics.stage(self.stage, len(self.lines)):
+            return self._merge(output_dir, format, compression)
+
+    def _merge(self, output_dir: str, format: str, compression: int) -> str:
+        if format not in FORMATS:
+            raise ValueError(f"Unknown format {format!r}, expected one of {FORMATS}")
+
+        os.makedirs(output_dir, exist_ok=True)
+        list_name = f"{self.chara_id}.list"
+        rows = []
+        written = set()
+
+        if format == "dir":
+            output_path = os.path.join(output_dir, self.chara_id)
+            os.makedirs(output_path, exist_ok=True)
+            for name, source, row in self.entries():
+                rows.append(row)
+                if name not in written:
+                    written.add(name)
+                    target = os.path.join(output_path, name)
+                    if os.path.exists(target):
+                        os.remove(target)
+                    clone(source, target)
+            with open(os.path.join(output_path, list_name), "w", encoding="utf-8") as f:
+                f.writelines(f"{row}\n" for row in rows)
+            return output_path
+
+        output_path = os.path.join(output_dir, f"{self.chara_id}.{format}")
+        # Write next to the target and rename, so an interrupted merge never leaves a broken archive
+        tmp_path = f"{output_path}.part"
+        if format == "zip":
+            with ZipFile(tmp_path, "w", compression=compression) as zipf:
+                for name, source, row in self.entries():
+                    rows.append(row)
+                    if name not in written:
+                        written.add(name)
+                        zipf.write(source, name)
+                zipf.writestr(list_name, "".join(f"{row}\n" for row in rows))
+        else:
+            with tarfile.open(tmp_path, "w") as tarf:
+                for name, source, row in self.entries():
+                    rows.append(row)
+                    if name not in written:
+                        written.add(name)
+                        tarf.add(source, name)
+                data = "".join(f"{row}\n" for row in rows).encode("utf-8")
+                info = tarfile.TarInfo(list_name)
+                info.size = len(data)
+                tarf.addfile(info, io.BytesIO(data))
+        os.replace(tmp_path, output_path)
+        return output_path
+
+
+def merge_characters(chara_ids: Iterable[str], store: Optional[CatalogStore] = None,
+                     asset_json_path: Optional[str] = None, voice_json_path: Optional[str] = None,
+                     output_dir: str = ".", format: str = MERGE_FORMAT, compression: int = ZIP_STORED,
+                     max_workers: int = MAX_WORKERS, locale: Locale = CURRENT_LOCALE,
+                     transcoder: Optional[Transcoder] = None) -> Dict[str, str]:
+    """
+    Merge several characters concurrently, reading the store or loading the JSON files only once.
+    A transcoder is shared by all characters, so voice files they have in common are converted once.
+    Returns the output path of every character that has lines.
+    """
+    chara_ids = [str(chara_id) for chara_id in chara_ids]
+    if store is not None:
+        mergers = [AssetMerger(chara_id, store=store, locale=locale, transcoder=transcoder) for chara_id in chara_ids]
+    else:
+        with open(asset_json_path, "r", encoding="utf-8") as f:
+            lines = json.load(f)
+        with open(voice_json_path, "r", encoding="utf-8") as f:
+            voices = json.load(f)
+        mergers = [AssetMerger.from_data(chara_id, lines.get(chara_id, []), voices, locale, transcoder) for chara_id in chara_ids]
 
+    for merger in mergers:
+        if not merger.lines:
+            console.print(f"[yellow]Character {merger.chara_id} has no lines. Skipping...")
+    mergers = [merger for merger in mergers if merger.lines]
 
-    
\ No newline at end of file
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {merger.chara_id: executor.submit(merger.merge, output_dir, format, compression) for merger in mergers}
+    return {chara_id: future.result() for chara_id, future in futures.items()}
\ No newline at end of file
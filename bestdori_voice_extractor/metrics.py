@@ -0,0 +1,331 @@
+import cProfile
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from rich.progress import BarColumn, MofNCompleteColumn, Progress, ProgressColumn, TextColumn, TimeElapsedColumn
+from rich.text import Text
+
+from bestdori_voice_extractor import console
+from bestdori_voice_extractor.config import METRICS_PREFIX, PROFILE_DIR, PROGRESS
+
+Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+def _key(name: str, labels: Dict[str, object]) -> Key:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Stage:
+    """
+    Timing of one named stage, such as the download into one directory or the merge of one character.
+    """
+    name: str
+    start: float
+    end: Optional[float]
+    # Items done and expected, kept whether or not a progress bar is shown
+    completed: int
+    total: Optional[int]
+
+    def __init__(self, name: str, total: Optional[int] = None):
+        self.name = name
+        self.start = time.perf_counter()
+        self.end = None
+        self.completed = 0
+        self.total = total
+
+    @property
+    def seconds(self) -> float:
+        return (self.end or time.perf_counter()) - self.start
+
+
+class StatsColumn(ProgressColumn):
+    """
+    Bytes per second, queue depth and retries of the stage of a progress task.
+    """
+
+    def __init__(self, metrics: "Metrics"):
+        super().__init__()
+        self.metrics = metrics
+
+    def render(self, task) -> Text:
+        stage = task.fields["stage"]
+        parts = []
+        rate = self.metrics.rate(stage)
+        if rate:
+            parts.append(f"{rate / 1e6:.2f} MB/s")
+        queue = self.metrics.gauge("queue_depth", stage=stage)
+        if queue:
+            parts.append(f"queue {int(queue)}")
+        retries = self.metrics.total("http_retries_total")
+        if retries:
+            parts.append(f"retries {int(retries)}")
+        return Text(" · ".join(parts), style="cyan")
+
+
+class Metrics:
+    """
+    Counters, gauges and stage timings shared by the downloaders, analyzers, merger and pipeline.
+
+    Running stages are shown as a live progress bar on terminals. snapshot() and prometheus() give a
+    machine-readable view, and with a profile directory every stage is profiled with cProfile.
+    """
+    counters: Dict[Key, float]
+    gauges: Dict[Key, float]
+    stages: Dict[str, Stage]
+    profile_dir: str
+    progress_enabled: bool
+
+    def __init__(self, profile_dir: str = PROFILE_DIR, progress: bool = PROGRESS):
+        self.counters = {}
+        self.gauges = {}
+        self.stages = {}
+        self.profile_dir = profile_dir
+        self.progress_enabled = progress
+        self._lock = threading.Lock()
+        # Separate from _lock, which the progress bar takes while rendering under its own lock
+        self._progress_lock = threading.Lock()
+        self._progress: Optional[Progress] = None
+        self._tasks: Dict[str, int] = {}
+        self._totals: Dict[str, int] = {}
+        # Held by the stage being profiled
+        self._profiling = threading.Lock()
+        # Stage name -> callers inside it, which share one Stage while it runs
+        self._users: Dict[str, int] = {}
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        with self._lock:
+            self.gauges[_key(name, labels)] = value
+
+    def add_gauge(self, name: str, delta: float, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self.gauges[key] = self.gauges.get(key, 0) + delta
+
+    def counter(self, name: str, **labels) -> float:
+        with self._lock:
+            return self.counters.get(_key(name, labels), 0)
+
+    def gauge(self, name: str, **labels) -> float:
+        with self._lock:
+            return self.gauges.get(_key(name, labels), 0)
+
+    def total(self, name: str) -> float:
+        """
+        Sum of a counter over all its labels.
+        """
+        with self._lock:
+            return sum(value for (key, _), value in self.counters.items() if key == name)
+
+    def rate(self, stage: str) -> float:
+        """
+        Bytes per second transferred by a stage so far.
+        """
+        with self._lock:
+            current = self.stages.get(stage)
+        if current is None or not current.seconds:
+            return 0.0
+        return self.counter("bytes_total", stage=stage) / current.seconds
+
+    def advance(self, stage: str, n: int = 1):
+        with self._lock:
+            current = self.stages.get(stage)
+            if current is not None:
+                current.completed += n
+        with self._progress_lock:
+            task = self._tasks.get(stage)
+            if task is not None:
+                self._progress.advance(task, n)
+
+    def add_total(self, stage: str, n: int):
+        with self._lock:
+            current = self.stages.get(stage)
+            if current is not None:
+                current.total = (current.total or 0) + n
+        with self._progress_lock:
+            task = self._tasks.get(stage)
+            if task is not None:
+                self._totals[stage] = self._totals.get(stage, 0) + n
+                self._progress.update(task, total=self._totals[stage])
+
+    def progress(self, stage: str) -> Optional[Tuple[int, Optional[int]]]:
+        """
+        Items done and expected by a stage, or None if it has not started.
+        """
+        with self._lock:
+            current = self.stages.get(stage)
+            return (current.completed, current.total) if current is not None else None
+
+    def _show(self, name: str, total: Optional[int]):
+        if not self.progress_enabled or not console.is_terminal or console.quiet:
+            return
+        with self._progress_lock:
+            if self._progress is None:
+                self._progress = Progress(
+                    TextColumn("[bold]{task.description}"), BarColumn(), MofNCompleteColumn(),
+                    TimeElapsedColumn(), StatsColumn(self), console=console,
+                )
+                self._progress.start()
+            self._tasks[name] = self._progress.add_task(name, total=total, stage=name)
+            if total is not None:
+                self._totals[name] = total
+
+    def _hide(self, name: str):
+        with self._progress_lock:
+            self._totals.pop(name, None)
+            task = self._tasks.pop(name, None)
+            if task is not None:
+                self._progress.remove_task(task)
+            if self._progress is not None and not self._tasks:
+                self._progress.stop()
+                self._progress = None
+
+    @contextmanager
+    def _profile(self, name: str) -> Iterator[None]:
+        """
+        Profile the calling thread and every thread started during the stage, such as executor workers.
+
+        Only one stage is profiled at a time, since the hooks involved are process-wide. Stages that
+        run meanwhile, such as the merges of merge_characters, are counted in the profile of that stage.
+        """
+        if not self._profiling.acquire(blocking=False):
+            yield
+            return
+
+        profiles: List[cProfile.Profile] = []
+        main = cProfile.Profile()
+        # From Python 3.12 a profile sees every thread, and a second one cannot be enabled alongside it
+        per_thread = sys.version_info < (3, 12)
+
+        def start(*args):
+            sys.setprofile(None)
+            profile = cProfile.Profile()
+            profiles.append(profile)
+            profile.enable()
+
+        if per_thread:
+            threading.setprofile(start)
+        main.enable()
+        try:
+            yield
+        finally:
+            main.disable()
+            if per_thread:
+                threading.setprofile(None)
+            self._profiling.release()
+            stats = pstats.Stats(main)
+            for profile in profiles:
+                stats.add(profile)
+            os.makedirs(self.profile_dir, exist_ok=True)
+            path = os.path.join(self.profile_dir, f"{''.join(c if c.isalnum() else '_' for c in name)}.prof")
+            stats.dump_stats(path)
+            console.print(f"Profile of [yellow]{name}[/] written to {path}")
+
+    @contextmanager
+    def stage(self, name: str, total: Optional[int] = None) -> Iterator[Stage]:
+        """
+        Time a stage, show it in the progress bar and profile it if a profile directory is set.
+        Entering a stage that is already running, such as the download of one locale by concurrent
+        service jobs, joins it: its total grows and it ends when the last caller leaves.
+        """
+        with self._lock:
+            users = self._users.get(name, 0)
+            self._users[name] = users + 1
+            if not users:
+                current = self.stages[name] = Stage(name, total)
+            else:
+                current = self.stages[name]
+        if users:
+            if total:
+                self.add_total(name, total)
+            try:
+                yield current
+            finally:
+                self._leave(name)
+            return
+
+        self._show(name, total)
+        try:
+            if self.profile_dir:
+                with self._profile(name):
+                    yield current
+            else:
+                yield current
+        finally:
+            self._leave(name)
+
+    def _leave(self, name: str):
+        with self._lock:
+            self._users[name] -= 1
+            if self._users[name]:
+                return
+            del self._users[name]
+            current = self.stages[name]
+            current.end = time.perf_counter()
+        self.set_gauge("stage_seconds", current.seconds, stage=name)
+        self._hide(name)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            counters = dict(self.counters)
+            gauges = dict(self.gauges)
+            stages = dict(self.stages)
+        return {
+            "counters": [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in sorted(counters.items())],
+            "gauges": [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in sorted(gauges.items())],
+            "stages": {
+                name: {
+                    "seconds": current.seconds,
+                    "running": current.end is None,
+                    "completed": current.completed,
+                    "total": current.total,
+                    "bytes_per_second": counters.get(_key("bytes_total", {"stage": name}), 0) / current.seconds if current.seconds else 0,
+                }
+                for name, current in stages.items()
+            },
+        }
+
+    def prometheus(self) -> str:
+        """
+        Render all counters and gauges in the Prometheus text exposition format.
+        """
+        with self._lock:
+            families = [("counter", self.counters.copy()), ("gauge", self.gauges.copy())]
+        lines = []
+        for kind, values in families:
+            names = sorted({name for name, _ in values})
+            for name in names:
+                lines.append(f"# TYPE {METRICS_PREFIX}{name} {kind}")
+                for (key, labels), value in sorted(values.items()):
+                    if key != name:
+                        continue
+                    rendered = ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+                    lines.append(f"{METRICS_PREFIX}{name}{{{rendered}}} {value:g}" if rendered else f"{METRICS_PREFIX}{name} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, file_path: str):
+        """
+        Write the metrics to file_path, in the Prometheus text format for .prom files and as JSON otherwise.
+        """
+        with open(file_path, "w", encoding="utf-8") as f:
+            if file_path.endswith(".prom"):
+                f.write(self.prometheus())
+            else:
+                json.dump(self.snapshot(), f, ensure_ascii=False, indent=4)
+
+
+metrics = Metrics()
\ No newline at end of file
@@ -0,0 +1,181 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
+from zipfile import ZIP_STORED, ZipFile
+
+from bestdori_voice_extractor import console
+from bestdori_voice_extractor.analyzer.asset import AssetAnalyzer
+from bestdori_voice_extractor.config import CURRENT_LOCALE, MAX_WORKERS, VOICE_INDEX_PATH
+from bestdori_voice_extractor.downloader import locale_path
+from bestdori_voice_extractor.downloader.asset import AssetDownloader
+from bestdori_voice_extractor.downloader.base import BaseTraverseDownloader
+from bestdori_voice_extractor.downloader.index import VoiceIndex
+from bestdori_voice_extractor.downloader.voice import VoiceDownloader
+from bestdori_voice_extractor.locale import Locale
+from bestdori_voice_extractor.metrics import metrics
+
+
+class CharacterPipeline:
+    """
+    Streams one character from scenario download to archive in a single pass.
+
+    Scenarios are parsed as soon as they are on disk, every wanted voice is downloaded as soon as
+    its location is known from the voice index, and every finished voice is appended to the archive
+    right away. The .list is written into the archive once all voices are done.
+    """
+    chara_id: str
+    locale: Locale
+    # Name of the pipeline in metrics and progress
+    stage: str
+    assets: AssetDownloader
+    voices: VoiceDownloader
+    index: VoiceIndex
+    executor: ThreadPoolExecutor
+
+    def __init__(self, chara_id: str, assets: Optional[AssetDownloader] = None, voices: Optional[VoiceDownloader] = None,
+                 index: Optional[VoiceIndex] = None, locale: Locale = CURRENT_LOCALE):
+        self.chara_id = str(chara_id)
+        self.locale = Locale(locale)
+        self.stage = f"extract {self.chara_id} {self.locale}"
+        self.assets = assets or AssetDownloader(locale_path("assets", self.locale), locale=self.locale)
+        self.voices = voices or VoiceDownloader(locale_path("voices", self.locale), locale=self.locale)
+        self.index = index or VoiceIndex(VOICE_INDEX_PATH.format(locale=self.locale))
+        self.executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+
+        self._lock = threading.Lock()
+        self._zip_lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._outstanding = 0
+        # Voice ID -> texts of the lines using it
+        self._texts: Dict[str, List[str]] = {}
+        # Voice ID -> (prefix, directory, file name)
+        self._locations: Dict[str, Tuple[Tuple[str, ...], str, str]] = {}
+        self._unlocated: Set[str] = set()
+        self._requested: Set[str] = set()
+        self._written: Set[str] = set()
+        self._rows: List[str] = []
+        self._zipf: ZipFile = None
+
+    def _submit(self, fn, *args):
+        with self._lock:
+            self._outstanding += 1
+        self.executor.submit(self._task, fn, *args)
+
+    def _task(self, fn, *args):
+        try:
+            fn(*args)
+        except Exception as e:
+            console.print(f"[red]Pipeline task failed[/]: {e}")
+        finally:
+            with self._lock:
+                self._outstanding -= 1
+                self._idle.notify_all()
+
+    @staticmethod
+    def _fetch(downloader: BaseTraverseDownloader, prefix: Tuple[str, ...], directory: str, asset: str,
+               changed: Optional[float] = None) -> str:
+        """
+        Download a file unless the manifest says it is complete and, given the time its listing last
+        changed, confirmed since then. Return its local path.
+        """
+        download_path = downloader._path(prefix, directory, asset)
+        if downloader._pending(download_path, changed):
+            downloader._download(prefix, directory, asset)
+        return download_path
+
+    def _scenario_listing(self, prefix: Tuple[str, ...], directory: str):
+        listing = self.assets.listing_cache.load(self.assets._listing_url(prefix, directory))
+        for asset in listing.data:
+            if self.assets._wanted(asset):
+                self._submit(self._scenario, prefix, directory, asset, listing.changed)
+
+    def _scenario(self, prefix: Tuple[str, ...], directory: str, asset: str, changed: float):
+        download_path = self._fetch(self.assets, prefix, directory, asset, changed)
+        if not os.path.exists(download_path):
+            return
+        for character_id, lines in AssetAnalyzer._parse(download_path).items():
+            if str(character_id) == self.chara_id:
+                for line in lines:
+                    self._want(line.voice_file, line.text)
+
+    def _locate(self, locations: Dict[str, Tuple[Tuple[str, ...], str, str]]):
+        """
+        Add voice locations and start the voices that were waiting for them.
+        """
+        found = []
+        with self._lock:
+            self._locations.update(locations)
+            for voice_id in self._unlocated & locations.keys():
+                self._unlocated.remove(voice_id)
+                self._requested.add(voice_id)
+                found.append(voice_id)
+        metrics.add_total(self.stage, len(found))
+        for voice_id in found:
+            self._submit(self._voice, voice_id)
+
+    def _wait(self):
+        with self._lock:
+            while self._outstanding:
+                self._idle.wait()
+
+    def _want(self, voice_id: str, text: str):
+        with self._lock:
+            self._texts.setdefault(voice_id, []).append(text)
+            if voice_id in self._written:
+                self._rows.append(f"{voice_id}.mp3|{self.chara_id}|{self.locale}|{text}")
+                return
+            if voice_id in self._requested or voice_id in self._unlocated:
+                return
+            if voice_id not in self._locations:
+                self._unlocated.add(voice_id)
+                return
+            self._requested.add(voice_id)
+        metrics.add_total(self.stage, 1)
+        self._submit(self._voice, voice_id)
+
+    def _voice(self, voice_id: str):
+        try:
+            download_path = self._fetch(self.voices, *self._locations[voice_id])
+            if not os.path.exists(download_path):
+                return
+            with self._zip_lock:
+                self._zipf.write(download_path, f"{voice_id}.mp3")
+            metrics.inc("bytes_total", os.path.getsize(download_path), stage=self.stage)
+            with self._lock:
+                self._written.add(voice_id)
+                for text in self._texts[voice_id]:
+                    self._rows.append(f"{voice_id}.mp3|{self.chara_id}|{self.locale}|{text}")
+        finally:
+            metrics.advance(self.stage)
+
+    def run(self, output_dir: str = ".") -> str:
+        """
+        Build <output_dir>/<chara_id>.zip and return its path.
+        """
+        console.print(f"[yellow bold]Launching pipeline for character {self.chara_id}...")
+        os.makedirs(output_dir, exist_ok=True)
+        output_path = os.path.join(output_dir, f"{self.chara_id}.zip")
+        tmp_path = f"{output_path}.part"
+
+        with metrics.stage(self.stage), ZipFile(tmp_path, "w", compression=ZIP_STORED) as self._zipf:
+            self._locate(self.index.all())
+            for prefix, directory, _ in self.assets.traverse(*self.assets.ENTRYPOINT()):
+                self._submit(self._scenario_listing, prefix, directory)
+            self._wait()
+
+            # Voices missing from the index may be new, look them up once more after refreshing it
+            if self._unlocated:
+                self._locate(self.index.resolve(self.voices, self._unlocated))
+                self._wait()
+
+            with self._lock:
+                if self._unlocated:
+                    metrics.inc("missing_voices_total", len(self._unlocated), stage=self.stage)
+                    console.print(f"[yellow]{len(self._unlocated)}[/] voice files not found. Skipping...")
+                self._zipf.writestr(f"{self.chara_id}.list", "".join(f"{row}\n" for row in self._rows))
+
+        self.executor.shutdown()
+        os.replace(tmp_path, output_path)
+        console.print(f"[green bold]Wrote {len(self._written)} voices and {len(self._rows)} lines to {output_path}")
+        return output_path
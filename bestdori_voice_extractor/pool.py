@@ -0,0 +1,119 @@
+import hashlib
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+from bestdori_voice_extractor import console
+from bestdori_voice_extractor.config import MAX_WORKERS
+
+# ioctl request number of FICLONE on Linux
+FICLONE = 0x40049409
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _reflink(src: str, dst: str):
+    import fcntl
+
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+
+
+def clone(src: str, dst: str):
+    """
+    Make dst share the content of src: a hardlink if possible, then a reflink, then a plain copy.
+    """
+    try:
+        os.link(src, dst)
+        return
+    except OSError:
+        pass
+    try:
+        _reflink(src, dst)
+        return
+    except (ImportError, OSError):
+        if os.path.exists(dst):
+            os.remove(dst)
+    shutil.copyfile(src, dst)
+
+
+class VoicePool:
+    """
+    Content-addressed store of downloaded files. Every file added is hardlinked to a blob named
+    after its SHA-256, so identical files across locales, directories and outputs share one copy.
+    """
+    root: str
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _blob(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest)
+
+    def add(self, path: str) -> str:
+        """
+        Hash path, make it a hardlink of the matching blob and return the digest.
+        Files that cannot be hardlinked, e.g. on another filesystem, are left as they are.
+        """
+        digest = file_sha256(path)
+        blob = self._blob(digest)
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        try:
+            os.link(path, blob)
+            return digest
+        except FileExistsError:
+            pass
+        except OSError as e:
+            console.print(f"[yellow]Cannot pool {path}[/]: {e}")
+            return digest
+
+        if not os.path.samefile(blob, path):
+            tmp_path = f"{path}.pool"
+            try:
+                os.link(blob, tmp_path)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                console.print(f"[yellow]Cannot pool {path}[/]: {e}")
+        return digest
+
+    def link(self, digest: str, dst: str) -> bool:
+        """
+        Materialize a blob at dst. Returns False if the pool does not hold it.
+        """
+        blob = self._blob(digest)
+        if not os.path.exists(blob):
+            return False
+        clone(blob, dst)
+        return True
+
+    def evict(self, digest: str) -> bool:
+        """
+        Remove a blob whose content no longer matches its digest, so that it is not linked to again.
+        Returns whether it was removed.
+        """
+        blob = self._blob(digest)
+        if not os.path.exists(blob) or file_sha256(blob) == digest:
+            return False
+        os.remove(blob)
+        return True
+
+    def dedup(self, dir_path: str) -> int:
+        """
+        Add every file below dir_path to the pool and return the number of bytes saved.
+        """
+        paths = [os.path.join(root, file) for root, _, files in os.walk(dir_path) for file in files if not file.endswith(".part")]
+        before = {path: os.stat(path).st_nlink for path in paths}
+
+        def add(path):
+            self.add(path)
+            # A file that was not linked to anything before now shares its content
+            return os.path.getsize(path) if before[path] == 1 and os.stat(path).st_nlink > 2 else 0
+
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            return sum(executor.map(add, paths))
@@ -0,0 +1,352 @@
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from bestdori_voice_extractor import console
+from bestdori_voice_extractor.analyzer.asset import AssetAnalyzer
+from bestdori_voice_extractor.config import (
+    CATALOG_PATH,
+    CURRENT_LOCALE,
+    LISTING_TTL,
+    MERGE_FORMAT,
+    SERVICE_HOST,
+    SERVICE_JOBS,
+    SERVICE_OUTPUT_DIR,
+    SERVICE_PORT,
+    SERVICE_RETENTION,
+    VOICE_INDEX_PATH,
+)
+from bestdori_voice_extractor.downloader import locale_path
+from bestdori_voice_extractor.downloader.asset import AssetDownloader
+from bestdori_voice_extractor.downloader.cache import get_bestdori_info
+from bestdori_voice_extractor.downloader.index import VoiceIndex
+from bestdori_voice_extractor.downloader.voice import VoiceDownloader
+from bestdori_voice_extractor.locale import Locale
+from bestdori_voice_extractor.merger import FORMATS, AssetMerger
+from bestdori_voice_extractor.metrics import metrics
+from bestdori_voice_extractor.store import CatalogStore
+from bestdori_voice_extractor.transcode import Transcoder
+
+STATUSES = ("queued", "refreshing", "downloading", "merging", "done", "failed")
+
+
+class Job:
+    """
+    One extraction request: the voices and .list of a character in one locale.
+    """
+    id: str
+    chara_id: str
+    locale: Locale
+    format: str
+    wav: bool
+    status: str
+    # Items done and expected by the step the job is in, if known
+    progress: Optional[Callable[[], Optional[Tuple[int, Optional[int]]]]]
+    output_path: Optional[str]
+    error: Optional[str]
+    created: float
+    started: Optional[float]
+    finished: Optional[float]
+
+    def __init__(self, chara_id: str, locale: Locale = CURRENT_LOCALE, format: str = MERGE_FORMAT, wav: bool = False):
+        self.id = uuid.uuid4().hex[:12]
+        self.chara_id = str(chara_id)
+        self.locale = Locale(locale)
+        self.format = format
+        self.wav = wav
+        self.status = "queued"
+        self.progress = None
+        self.output_path = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+
+    @property
+    def key(self) -> Tuple[str, Locale, str, bool]:
+        return self.chara_id, self.locale, self.format, self.wav
+
+    @property
+    def active(self) -> bool:
+        return self.status not in ("done", "failed")
+
+    def __json__(self) -> Dict:
+        progress = self.progress() if self.progress is not None and self.active else None
+        return {
+            "id": self.id,
+            "chara_id": self.chara_id,
+            "locale": str(self.locale),
+            "format": self.format,
+            "wav": self.wav,
+            "status": self.status,
+            "progress": {"completed": progress[0], "total": progress[1]} if progress else None,
+            "output_path": self.output_path,
+            "error": self.error,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+        }
+
+
+class ExtractionService:
+    """
+    Long-running extraction service. The HTTP session, the listing cache, the catalog of every locale
+    and the voice indexes stay warm between jobs, so a job only downloads the voices it is missing
+    and merges them.
+
+    The catalog of a locale is built by the first job that needs it and rebuilt when it is older
+    than LISTING_TTL or on request, incrementally thanks to the manifest and the analysis cache.
+    """
+    store: CatalogStore
+    output_dir: str
+    # Seconds finished jobs are kept
+    retention: float
+    jobs: Dict[str, Job]
+    executor: ThreadPoolExecutor
+
+    def __init__(self, store: Optional[CatalogStore] = None, output_dir: str = SERVICE_OUTPUT_DIR,
+                 max_jobs: int = SERVICE_JOBS, retention: float = SERVICE_RETENTION):
+        self.store = store or CatalogStore(CATALOG_PATH)
+        self.output_dir = output_dir
+        self.retention = retention
+        self.jobs = {}
+        self.executor = ThreadPoolExecutor(max_workers=max_jobs)
+        self._lock = threading.Lock()
+        # Locale -> time of the last catalog build
+        self._refreshed: Dict[Locale, float] = {}
+        self._refresh_locks: Dict[Locale, threading.Lock] = {}
+        # Locale -> downloader or analyzer of the running refresh
+        self._refreshing: Dict[Locale, Union[AssetDownloader, AssetAnalyzer]] = {}
+        self._indexes: Dict[Locale, VoiceIndex] = {}
+        self._transcoder: Optional[Transcoder] = None
+
+    def _refresh_lock(self, locale: Locale) -> threading.Lock:
+        with self._lock:
+            return self._refresh_locks.setdefault(locale, threading.Lock())
+
+    def _index(self, locale: Locale) -> VoiceIndex:
+        with self._lock:
+            if locale not in self._indexes:
+                self._indexes[locale] = VoiceIndex(VOICE_INDEX_PATH.format(locale=locale))
+            return self._indexes[locale]
+
+    def _transcoder_for(self, job: Job) -> Optional[Transcoder]:
+        if not job.wav:
+            return None
+        with self._lock:
+            # Shared by all jobs, so that at most one ffmpeg process runs per core
+            if self._transcoder is None:
+                self._transcoder = Transcoder()
+            return self._transcoder
+
+    def refresh(self, locale: Locale = CURRENT_LOCALE, force: bool = False):
+        """
+        Sync and analyze the scenarios of a locale unless that was done less than LISTING_TTL seconds ago.
+        Jobs of the locale wait for a running refresh instead of starting another one.
+        """
+        locale = Locale(locale)
+        with self._refresh_lock(locale):
+            if not force and time.time() - self._refreshed.get(locale, 0) < LISTING_TTL:
+                return
+            # Pick up directories added since the asset tree was last loaded
+            get_bestdori_info(locale, refresh=True)
+            assets = locale_path("assets", locale)
+            try:
+                downloader = self._refreshing[locale] = AssetDownloader(assets, locale=locale)
+                downloader.run()
+                analyzer = self._refreshing[locale] = AssetAnalyzer(locale=locale)
+                analyzer.run(assets, store=self.store)
+            finally:
+                self._refreshing.pop(locale, None)
+            self._refreshed[locale] = time.time()
+
+    def _refresh_progress(self, locale: Locale) -> Optional[Tuple[int, Optional[int]]]:
+        step = self._refreshing.get(locale)
+        return metrics.progress(step.stage) if step is not None else None
+
+    def prune(self):
+        """
+        Forget jobs that finished more than the retention time ago and remove their output.
+        """
+        cutoff = time.time() - self.retention
+        with self._lock:
+            expired = [job for job in self.jobs.values() if not job.active and job.finished < cutoff]
+            for job in expired:
+                del self.jobs[job.id]
+        for job in expired:
+            shutil.rmtree(os.path.join(self.output_dir, job.id), ignore_errors=True)
+
+    def submit(self, chara_id: str, locale: Locale = CURRENT_LOCALE, format: str = MERGE_FORMAT, wav: bool = False) -> Job:
+        """
+        Queue an extraction job, or return the queued or running job that already does the same.
+        """
+        if format not in FORMATS:
+            raise ValueError(f"Unknown format {format!r}, expected one of {FORMATS}")
+        if not str(chara_id).isdigit():
+            raise ValueError(f"Invalid character ID {chara_id!r}")
+        job = Job(chara_id, locale, format, wav)
+        self.prune()
+        with self._lock:
+            for other in self.jobs.values():
+                if other.active and other.key == job.key:
+                    return other
+            self.jobs[job.id] = job
+        self.executor.submit(self._run, job)
+        return job
+
+    def _run(self, job: Job):
+        job.started = time.time()
+        try:
+            job.status = "refreshing"
+            job.progress = lambda: self._refresh_progress(job.locale)
+            self.refresh(job.locale)
+            lines = self.store.lines(int(job.chara_id), job.locale)
+            if not lines:
+                raise ValueError(f"Character {job.chara_id} has no lines in locale {job.locale}")
+
+            job.status = "downloading"
+            # Concurrent jobs of a locale share its download stage, so each job counts its own files
+            downloader = VoiceDownloader(locale_path("voices", job.locale), locale=job.locale)
+            wanted = {line["voice_file"] for line in lines}
+            index = self._index(job.locale)
+            plan = downloader.plan_voices(wanted, index)
+            planned = sum(downloader.stats.values())
+            job.progress = lambda: (sum(downloader.stats.values()) - planned, plan.count)
+            downloader.run(engine="async", plan=plan)
+            voices = {
+                voice_id: downloader._path(*location) for voice_id, location in index.lookup(wanted).items()
+            }
+            voices = {voice_id: path for voice_id, path in voices.items() if os.path.exists(path)}
+
+            job.status = "merging"
+            merger = AssetMerger.from_data(job.chara_id, lines, voices, job.locale, self._transcoder_for(job))
+            job.progress = lambda: metrics.progress(merger.stage)
+            job.output_path = merger.merge(os.path.join(self.output_dir, job.id), job.format)
+            self._finish(job, "done")
+        except Exception as e:
+            job.error = f"{type(e).__name__}: {e}"
+            self._finish(job, "failed")
+            console.print(f"[red]Job {job.id} failed[/]: {job.error}")
+
+    def _finish(self, job: Job, status: str):
+        # Together under the lock, so that prune() never sees a finished job without its finish time
+        with self._lock:
+            job.finished = time.time()
+            job.status = status
+        metrics.inc("service_jobs_total", status=status)
+
+    def list_jobs(self) -> List[Job]:
+        self.prune()
+        with self._lock:
+            return sorted(self.jobs.values(), key=lambda job: job.created)
+
+    def job(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def serve(self, host: str = SERVICE_HOST, port: int = SERVICE_PORT):
+        """
+        Serve the HTTP API until interrupted.
+        """
+        server = ThreadingHTTPServer((host, port), type("Handler", (ServiceHandler,), {"service": self}))
+        server.daemon_threads = True
+        console.print(f"Serving extraction jobs on [bold]http://{host}:{server.server_address[1]}[/]")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.executor.shutdown(wait=False)
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """
+    JSON API of the extraction service:
+
+        POST /jobs              {"chara_id": 36, "locale": "jp", "format": "zip", "wav": false}
+        GET  /jobs              all jobs
+        GET  /jobs/<id>         status and progress of a job
+        GET  /jobs/<id>/output  the archive of a finished job
+        POST /refresh           {"locale": "jp"}, rebuild the catalog of a locale
+        GET  /metrics           metrics in the Prometheus text format
+    """
+    service: ExtractionService
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str = "application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, status: int, data):
+        body = json.dumps(data, default=lambda obj: obj.__json__(), ensure_ascii=False)
+        self._send(status, body.encode("utf-8"))
+
+    def _error(self, status: int, message: str):
+        self._json(status, {"error": message})
+
+    def _body(self) -> Dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        data = json.loads(self.rfile.read(length) or b"{}")
+        if not isinstance(data, dict):
+            raise ValueError("Expected a JSON object")
+        return data
+
+    def _output(self, job: Job):
+        if job.status != "done":
+            return self._error(409, f"Job {job.id} is {job.status}")
+        if os.path.isdir(job.output_path):
+            return self._error(409, f"Job {job.id} wrote a directory: {job.output_path}")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(os.path.getsize(job.output_path)))
+        self.send_header("Content-Disposition", f'attachment; filename="{os.path.basename(job.output_path)}"')
+        self.end_headers()
+        with open(job.output_path, "rb") as f:
+            shutil.copyfileobj(f, self.wfile)
+
+    def do_GET(self):
+        parts = [part for part in self.path.split("?", 1)[0].split("/") if part]
+        if parts == ["jobs"]:
+            return self._json(200, self.service.list_jobs())
+        if parts == ["metrics"]:
+            return self._send(200, metrics.prometheus().encode("utf-8"), "text/plain; version=0.0.4")
+        if len(parts) in (2, 3) and parts[0] == "jobs":
+            job = self.service.job(parts[1])
+            if job is None:
+                return self._error(404, f"Unknown job {parts[1]}")
+            if len(parts) == 2:
+                return self._json(200, job)
+            if parts[2] == "output":
+                return self._output(job)
+        self._error(404, f"Not found: {self.path}")
+
+    def do_POST(self):
+        try:
+            data = self._body()
+            if self.path == "/jobs":
+                job = self.service.submit(
+                    data["chara_id"], Locale(data.get("locale", CURRENT_LOCALE)),
+                    data.get("format", MERGE_FORMAT), bool(data.get("wav", False)),
+                )
+                return self._json(202, job)
+            if self.path == "/refresh":
+                locale = Locale(data.get("locale", CURRENT_LOCALE))
+                self.service.executor.submit(self.service.refresh, locale, True)
+                return self._json(202, {"locale": str(locale)})
+        except KeyError as e:
+            return self._error(400, f"Missing field {e}")
+        except ValueError as e:
+            return self._error(400, str(e))
+        self._error(404, f"Not found: {self.path}")
\ No newline at end of file
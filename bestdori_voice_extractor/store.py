@@ -0,0 +1,146 @@
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from bestdori_voice_extractor.config import CURRENT_LOCALE
+from bestdori_voice_extractor.locale import Locale
+
+
+class CatalogStore:
+    """
+    Indexed SQLite store of analyzed lines and local voice files, for any number of locales.
+    """
+    db_path: str
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            # Stores written before locales were tracked only hold derived data, rebuild them
+            for table in ("lines", "voices"):
+                columns = [row[1] for row in self._conn.execute(f"PRAGMA table_info({table})")]
+                if columns and "locale" not in columns:
+                    self._conn.execute(f"DROP TABLE {table}")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS lines ("
+                "locale TEXT NOT NULL, chara_id INTEGER NOT NULL, seq INTEGER NOT NULL, text TEXT NOT NULL, "
+                "voice_id TEXT NOT NULL, PRIMARY KEY (locale, chara_id, seq))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS lines_voice_id ON lines (locale, voice_id)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS voices ("
+                "locale TEXT NOT NULL, voice_id TEXT NOT NULL, path TEXT NOT NULL, PRIMARY KEY (locale, voice_id))"
+            )
+
+    def put_lines(self, lines: Iterable[Tuple[int, str, str]], locale: Locale = CURRENT_LOCALE):
+        """
+        Replace all lines of a locale with (chara_id, text, voice_id) tuples, numbered in the given order per character.
+        """
+        locale = str(Locale(locale))
+        seqs: Dict[int, int] = {}
+
+        def rows():
+            for chara_id, text, voice_id in lines:
+                seq = seqs.get(chara_id, 0)
+                seqs[chara_id] = seq + 1
+                yield locale, chara_id, seq, text, voice_id
+
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM lines WHERE locale = ?", (locale,))
+            self._conn.executemany("INSERT INTO lines VALUES (?, ?, ?, ?, ?)", rows())
+
+    def put_voices(self, voices: Iterable[Tuple[str, str]], locale: Locale = CURRENT_LOCALE):
+        """
+        Replace all voice files of a locale with (voice_id, path) tuples.
+        """
+        locale = str(Locale(locale))
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM voices WHERE locale = ?", (locale,))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO voices VALUES (?, ?, ?)", ((locale, voice_id, path) for voice_id, path in voices)
+            )
+
+    def characters(self, locale: Locale = CURRENT_LOCALE) -> List[int]:
+        with self._lock:
+            return [row[0] for row in self._conn.execute(
+                "SELECT DISTINCT chara_id FROM lines WHERE locale = ? ORDER BY chara_id", (str(Locale(locale)),)
+            )]
+
+    def lines(self, chara_id: int, locale: Locale = CURRENT_LOCALE) -> List[Dict[str, str]]:
+        """
+        Return the lines of a character in the same shape as asset.json.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT text, voice_id FROM lines WHERE locale = ? AND chara_id = ? ORDER BY seq",
+                (str(Locale(locale)), int(chara_id)),
+            ).fetchall()
+        return [{"text": text, "voice_file": voice_id} for text, voice_id in rows]
+
+    def speakers(self, voice_id: str, locale: Locale = CURRENT_LOCALE) -> List[Tuple[int, str]]:
+        """
+        Return the (chara_id, text) pairs a voice file is used for.
+        """
+        with self._lock:
+            return self._conn.execute(
+                "SELECT chara_id, text FROM lines WHERE locale = ? AND voice_id = ? ORDER BY chara_id, seq",
+                (str(Locale(locale)), voice_id),
+            ).fetchall()
+
+    def voiced_lines(self, chara_ids: Optional[Iterable[int]] = None, min_chars: int = 0, max_chars: Optional[int] = None,
+                     locale: Locale = CURRENT_LOCALE) -> List[Tuple[int, str, str, str]]:
+        """
+        Return (chara_id, text, voice_id, path) of every line that has a local voice file and a text length
+        within the bounds, ordered by character and line. Without chara_ids, all characters are returned.
+        """
+        query = (
+            "SELECT lines.chara_id, lines.text, lines.voice_id, voices.path FROM lines "
+            "JOIN voices ON voices.locale = lines.locale AND voices.voice_id = lines.voice_id "
+            "WHERE lines.locale = ? AND length(lines.text) >= ?"
+        )
+        params = [str(Locale(locale)), min_chars]
+        if max_chars is not None:
+            query += " AND length(lines.text) <= ?"
+            params.append(max_chars)
+        if chara_ids is not None:
+            chara_ids = [int(chara_id) for chara_id in chara_ids]
+            if not chara_ids:
+                return []
+            query += f" AND lines.chara_id IN ({', '.join('?' * len(chara_ids))})"
+            params += chara_ids
+        with self._lock:
+            return self._conn.execute(query + " ORDER BY lines.chara_id, lines.seq", params).fetchall()
+
+    def voice(self, voice_id: str, locale: Locale = CURRENT_LOCALE) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT path FROM voices WHERE locale = ? AND voice_id = ?", (str(Locale(locale)), voice_id)
+            ).fetchone()
+        return row[0] if row else None
+
+    def voices(self, voice_ids: Iterable[str], locale: Locale = CURRENT_LOCALE) -> Dict[str, str]:
+        """
+        Return the paths of the given voice files that exist locally.
+        """
+        locale = str(Locale(locale))
+        voice_ids = list(voice_ids)
+        found = {}
+        with self._lock:
+            # Stay below SQLite's limit on the number of bound parameters
+            for i in range(0, len(voice_ids), 500):
+                chunk = voice_ids[i:i + 500]
+                found.update(self._conn.execute(
+                    f"SELECT voice_id, path FROM voices WHERE locale = ? AND voice_id IN ({', '.join('?' * len(chunk))})",
+                    [locale, *chunk],
+                ).fetchall())
+        return found
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,120 @@
+import hashlib
+import os
+import shutil
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, TypeVar
+
+from bestdori_voice_extractor import console
+from bestdori_voice_extractor.config import (
+    FFMPEG,
+    TRANSCODE_DIR,
+    TRANSCODE_LOUDNESS,
+    TRANSCODE_SAMPLE_RATE,
+    TRANSCODE_SILENCE,
+)
+from bestdori_voice_extractor.metrics import metrics
+from bestdori_voice_extractor.pool import file_sha256
+
+K = TypeVar("K")
+
+
+class Transcoder:
+    """
+    Converts voice files with ffmpeg to mono WAV at a fixed sample rate, with leading and trailing
+    silence trimmed and loudness normalized. Every ffmpeg process runs on its own core.
+
+    Results are cached by the SHA-256 of the source and the conversion settings, so re-runs and
+    characters sharing voice files convert each of them only once.
+    """
+    cache_dir: str
+    sample_rate: int
+    silence: Optional[float]
+    loudness: Optional[float]
+    ffmpeg: str
+    executor: ThreadPoolExecutor
+
+    def __init__(self, cache_dir: str = TRANSCODE_DIR, sample_rate: int = TRANSCODE_SAMPLE_RATE,
+                 silence: Optional[float] = TRANSCODE_SILENCE, loudness: Optional[float] = TRANSCODE_LOUDNESS,
+                 ffmpeg: str = FFMPEG, workers: Optional[int] = None):
+        if shutil.which(ffmpeg) is None:
+            raise FileNotFoundError(f"ffmpeg not found: {ffmpeg}")
+        self.cache_dir = cache_dir
+        self.sample_rate = sample_rate
+        self.silence = silence
+        self.loudness = loudness
+        self.ffmpeg = ffmpeg
+        # ffmpeg does the work in its own process, a thread per core only waits for it
+        self.executor = ThreadPoolExecutor(max_workers=workers or os.cpu_count())
+        self._settings = hashlib.sha256(" ".join(self.options()).encode()).hexdigest()[:12]
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def options(self) -> List[str]:
+        """
+        ffmpeg output options for the conversion settings.
+        """
+        filters = []
+        if self.silence is not None:
+            # silenceremove only trims the start, so trim the reversed audio a second time for the end
+            trim = f"silenceremove=start_periods=1:start_threshold={self.silence}dB"
+            filters += [trim, "areverse", trim, "areverse"]
+        if self.loudness is not None:
+            filters.append(f"loudnorm=I={self.loudness}:TP=-1.5:LRA=11")
+        options = ["-ac", "1"]
+        if filters:
+            options += ["-af", ",".join(filters)]
+        # After the filters, since loudnorm upsamples its output
+        return options + ["-ar", str(self.sample_rate), "-c:a", "pcm_s16le", "-f", "wav"]
+
+    def target(self, digest: str) -> str:
+        return os.path.join(self.cache_dir, self._settings, digest[:2], f"{digest}.wav")
+
+    def convert(self, source: str) -> Optional[str]:
+        """
+        Convert one file and return the path of the cached WAV, or None if ffmpeg cannot convert it.
+        """
+        target = self.target(file_sha256(source))
+        if os.path.exists(target):
+            metrics.inc("transcoded_files_total", source="cached")
+            return target
+
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        # Characters sharing a voice may convert it at the same time, give each its own temporary file
+        with self._lock:
+            self._counter += 1
+            tmp_path = f"{target}.{os.getpid()}.{self._counter}.part"
+        try:
+            subprocess.run(
+                [self.ffmpeg, "-nostdin", "-v", "error", "-y", "-i", source, *self.options(), tmp_path],
+                check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+            )
+            os.replace(tmp_path, target)
+        except (OSError, subprocess.CalledProcessError) as e:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            detail = e.stderr.decode("utf-8", "replace").strip() if isinstance(e, subprocess.CalledProcessError) else e
+            console.print(f"[red]Cannot convert {source}[/]: {detail}")
+            metrics.inc("transcoded_files_total", source="failed")
+            return None
+        metrics.inc("transcoded_files_total", source="converted")
+        metrics.inc("transcoded_bytes_total", os.path.getsize(target))
+        return target
+
+    def convert_all(self, sources: Dict[K, str], stage: Optional[str] = None) -> Dict[K, str]:
+        """
+        Convert files concurrently and return the WAV paths of those that could be converted.
+        With a stage, its progress advances by one per file.
+        """
+        if stage is not None:
+            metrics.add_total(stage, len(sources))
+        futures = {self.executor.submit(self.convert, source): key for key, source in sources.items()}
+        converted = {}
+        for future in as_completed(futures):
+            target = future.result()
+            if target is not None:
+                converted[futures[future]] = target
+            if stage is not None:
+                metrics.advance(stage)
+        return converted
\ No newline at end of file
@@ -1,18 +1,16 @@
-import json
 import os
 import argparse
 import requests
 import platform
-from typing import Set, Tuple, List, Dict
-from concurrent.futures import ThreadPoolExecutor
 
-from bestdori_voice_extractor.downloader import load, session
 from bestdori_voice_extractor.downloader.voice import VoiceDownloader
 from bestdori_voice_extractor.downloader.asset import AssetDownloader
 from bestdori_voice_extractor.analyzer.asset import AssetAnalyzer
 from bestdori_voice_extractor.analyzer.voice import VoiceAnalyzer
 from bestdori_voice_extractor.merger import AssetMerger
-from bestdori_voice_extractor.config import MAX_WORKERS, CURRENT_LOCALE
+from bestdori_voice_extractor.pipeline import CharacterPipeline
+from bestdori_voice_extractor.store import CatalogStore
+from bestdori_voice_extractor.config import CATALOG_PATH
 from bestdori_voice_extractor import console
 
 # --- Helper Functions ---
@@ -31,7 +29,7 @@ def fetch_character_metadata():
     url = "https://bestdori.com/api/characters/all.5.json"
     print("Fetching character list from Bestdori...")
     try:
-        response = requests.get(url)
+        response = requests.get(url, timeout=30)
         response.encoding = 'utf-8' 
         if response.status_code == 200:
             return response.json()
@@ -95,30 +93,6 @@ def display_characters(char_data):
             print(f"[{cid:>3}] {name_jp}  /  {name_en}  /  {name_cn}")
     print(f"\n{'='*60}\n")
 
-# --- Selective Download Logic (Reuse) ---
-
-class SelectiveVoiceDownloader(VoiceDownloader):
-    def __init__(self, wanted_voices: Set[str], save_path: str = "voices"):
-        super().__init__(save_path)
-        self.wanted_voices = wanted_voices
-
-    def _process(self, prefix: Tuple[str, ...], directory: str, asset: str):
-        url = f"https://bestdori.com/api/explorer/{CURRENT_LOCALE}/assets/{'/'.join(prefix)}/{directory}.json"
-        try:
-            asset_list: List[str] = load(url)
-        except Exception as e:
-            console.print(f"[red]Failed to load list {url}: {e}")
-            return
-
-        os.makedirs(f"{self.save_path}/{'/'.join(prefix)}/{directory}", exist_ok=True)
-        
-        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-            for asset_file in asset_list:
-                if asset_file.endswith(self.EXTENSION_TYPE()):
-                    name_without_ext = os.path.splitext(asset_file)[0]
-                    if name_without_ext in self.wanted_voices:
-                        executor.submit(self._download, prefix, directory, asset_file)
-
 # --- Main Logic ---
 
 def mode_cloud_download(chara_id):
@@ -130,17 +104,15 @@ def mode_cloud_download(chara_id):
     
     # 2. Analyze to find voices
     console.print(f"[bold cyan]Step 2: Analyzing Assets...[/]")
-    AssetAnalyzer().run("assets", "asset.json")
+    store = CatalogStore(CATALOG_PATH)
+    AssetAnalyzer().run("assets", store=store)
     
     # 3. Filter
-    with open("asset.json", "r", encoding="utf-8") as f:
-        data = json.load(f)
-    
-    if chara_id not in data:
+    character_data = store.lines(int(chara_id)) if chara_id.isdigit() else []
+    if not character_data:
         console.print(f"[red]Error: Character ID {chara_id} not found in assets analysis.[/]")
         return
 
-    character_data = data[chara_id]
     wanted_voices = set()
     for line in character_data:
         wanted_voices.add(line["voice_file"])
@@ -149,22 +121,23 @@ def mode_cloud_download(chara_id):
     
     # 4. Selective Download
     console.print(f"[bold cyan]Step 3: Downloading Specific Voice Files...[/]")
-    downloader = SelectiveVoiceDownloader(wanted_voices, "voices")
-    downloader.run()
+    downloader = VoiceDownloader("voices")
+    downloader.run(engine="async", plan=downloader.plan_voices(wanted_voices))
     
     # 5. Analyze Voices
     console.print(f"[bold cyan]Step 4: Mapping Local Voice Files...[/]")
-    VoiceAnalyzer().run("voices", "voice.json")
+    VoiceAnalyzer().run("voices", store=store)
     
     # 6. Merge
     console.print(f"[bold cyan]Step 5: Merging into Zip...[/]")
-    merger = AssetMerger(chara_id, "asset.json", "voice.json")
+    merger = AssetMerger(chara_id, store=store)
     merger.merge()
     console.print(f"[bold green]Success! Output saved to {chara_id}.zip[/]")
 
-    # Clean up empty output folder if it exists
-    if os.path.exists("output") and not os.listdir("output"):
-        os.rmdir("output")
+def mode_stream(chara_id):
+    console.print(f"\n[bold cyan]--- Mode: Streaming Pipeline for ID {chara_id} ---[/]")
+    output_path = CharacterPipeline(chara_id).run()
+    console.print(f"[bold green]Success! Output saved to {output_path}[/]")
 
 def mode_local_parse(chara_id):
     console.print(f"\n[bold cyan]--- Mode: Local Parse for ID {chara_id} ---[/]")
@@ -176,40 +149,24 @@ def mode_local_parse(chara_id):
         console.print("[red]Error: 'voices' folder not found. Cannot parse local files.[/]")
         return
 
-    # Check for existing JSONs to save time, but offer rebuild
-    skip_analysis = False
-    if os.path.exists("asset.json") and os.path.exists("voice.json"):
-        choice = input("Found existing asset.json and voice.json. Reuse them? (Y/n): ").strip().lower()
-        if choice in ['', 'y', 'yes']:
-            skip_analysis = True
-            console.print("[green]Reusing existing analysis files.[/]")
-        else:
-            console.print("[yellow]Re-analyzing local files...[/]")
+    # Analysis is incremental: only files added or changed since the last run are parsed
+    store = CatalogStore(CATALOG_PATH)
+    console.print(f"[bold cyan]Step 1: Analyzing Local Assets...[/]")
+    AssetAnalyzer().run("assets", store=store)
 
-    if not skip_analysis:
-        # Re-analyze ensures we catch all currently present files
-        console.print(f"[bold cyan]Step 1: Analyzing Local Assets...[/]")
-        AssetAnalyzer().run("assets", "asset.json")
-        
-        console.print(f"[bold cyan]Step 2: Analyzing Local Voices (This may take a while if you have many files)...[/]")
-        VoiceAnalyzer().run("voices", "voice.json")
+    console.print(f"[bold cyan]Step 2: Analyzing Local Voices...[/]")
+    VoiceAnalyzer().run("voices", store=store)
     
     console.print(f"[bold cyan]Step 3: Merging...[/]")
     # Check if char exists
-    with open("asset.json", "r", encoding="utf-8") as f:
-        data = json.load(f)
-        if chara_id not in data:
-            console.print(f"[red]Error: Character ID {chara_id} has no lines in the local assets.[/]")
-            return
+    if not chara_id.isdigit() or not store.lines(int(chara_id)):
+        console.print(f"[red]Error: Character ID {chara_id} has no lines in the local assets.[/]")
+        return
 
-    merger = AssetMerger(chara_id, "asset.json", "voice.json")
+    merger = AssetMerger(chara_id, store=store)
     merger.merge()
     console.print(f"[bold green]Success! Output saved to {chara_id}.zip[/]")
 
-    # Clean up empty output folder if it exists
-    if os.path.exists("output") and not os.listdir("output"):
-        os.rmdir("output")
-
 def main():
     # 1. Load Data Once
     char_data = fetch_character_metadata()
@@ -234,12 +191,15 @@ def main():
         print("\nSelect Mode:")
         print("1. [Cloud] Download & Extract (Downloads only needed files)")
         print("2. [Local] Parse & Extract (Uses existing files in 'assets' and 'voices')")
-        mode = input("Choice (1/2): ").strip()
+        print("3. [Stream] Download & Extract in one pass (Writes voices to the zip as they arrive)")
+        mode = input("Choice (1/2/3): ").strip()
 
         if mode == "1":
             mode_cloud_download(selected_id)
         elif mode == "2":
             mode_local_parse(selected_id)
+        elif mode == "3":
+            mode_stream(selected_id)
         else:
             print("Invalid choice. Please try again.")
             input("\nPress Enter to continue...")
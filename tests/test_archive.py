@@ -0,0 +1,66 @@
+import pytest
+
+from bestdori_voice_extractor.archive import VIEWS_PRUNE_AT, ArchiveReader
+from bestdori_voice_extractor.merger import AssetMerger
+
+VOICES = {"v1": b"ID3" + b"\x01" * 100, "v2": b"ID3" + b"\x02" * 200}
+LINES = [
+    {"text": "a", "voice_file": "v1"},
+    {"text": "b", "voice_file": "v2"},
+    {"text": "c", "voice_file": "v1"},
+]
+
+
+@pytest.fixture(params=["zip", "tar"])
+def archive_path(request, tmp_path):
+    voices = {}
+    for voice_id, data in VOICES.items():
+        path = tmp_path / f"{voice_id}.mp3"
+        path.write_bytes(data)
+        voices[voice_id] = str(path)
+    return AssetMerger.from_data("7", LINES, voices).merge(str(tmp_path / "out"), request.param)
+
+
+def test_iterate_and_close(archive_path):
+    with ArchiveReader(archive_path) as archive:
+        entries = list(archive)
+        assert [entry.row for entry in entries] == ["v1.mp3|7|jp|a", "v2.mp3|7|jp|b", "v1.mp3|7|jp|c"]
+        assert all(bytes(entry.data) == VOICES[entry.voice_id] for entry in entries)
+        assert archive.voice_ids() == ["v1", "v2"]
+        assert archive.rows_of("v1") == ["v1.mp3|7|jp|a", "v1.mp3|7|jp|c"]
+
+
+def test_close_while_view_is_held(archive_path):
+    with ArchiveReader(archive_path) as archive:
+        data = archive["v2"]
+        entry = next(iter(archive))
+        assert bytes(data) == VOICES["v2"]
+    with pytest.raises(ValueError):
+        bytes(data)
+    with pytest.raises(ValueError):
+        bytes(entry.data)
+
+
+def test_views_are_not_kept_after_use(archive_path):
+    with ArchiveReader(archive_path) as archive:
+        held = archive["v1"]
+        for _ in range(5000):
+            for entry in archive:
+                bytes(entry.data)
+        assert len(archive._views) < 2 * VIEWS_PRUNE_AT
+        assert bytes(held) == VOICES["v1"]
+    with pytest.raises(ValueError):
+        bytes(held)
+
+
+def test_check_reports_corrupt_entry(tmp_path):
+    path = tmp_path / "v1.mp3"
+    path.write_bytes(VOICES["v1"])
+    output_path = AssetMerger.from_data("7", LINES[:1], {"v1": str(path)}).merge(str(tmp_path / "out"))
+    with ArchiveReader(output_path) as archive:
+        offset = archive.members["v1.mp3"].offset
+    with open(output_path, "r+b") as f:
+        f.seek(offset + 10)
+        f.write(b"\xff")
+    with ArchiveReader(output_path) as archive:
+        assert archive.check() == ["v1.mp3"]
\ No newline at end of file